@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+BACKUP CATALOG shared by the scheduled backup scripts.
+- One SQLite index (catalog.sqlite, next to the job folders) of every file any run
+  backed up: rel_path -> run, container (zip part, batch folder or dedup store),
+  member inside it, size, mtime and hash. Each run adds its own files when it
+  finishes; older runs can be added once with `index`.
+- rel_paths are experiment_NN/__YYYYMMDD_XXXXX/... for both jobs, so a subject or an
+  experiment is found without opening any archive or listing any batch folder.
+- Restore picks, per rel_path, the newest copy at or before a point in time (the
+  latest baseline plus later deltas / batches), and reads only the zip members and
+  files it needs:
+    python backup_catalog.py index   <catalog.sqlite> [--data-dir D] [--video-dir V] [--store S]
+    python backup_catalog.py runs    <catalog.sqlite>
+    python backup_catalog.py find    <catalog.sqlite> [--subject __20160225_17406] [--experiment experiment_12]
+                                     [--path '*/cam01_video_r/*'] [--as-of 2024-05-01|<run>] [--job data|video]
+    python backup_catalog.py restore <catalog.sqlite> <target_dir> [same filters] [--link]
+  Zip members carry the zip's CRC-32 ("crc32:...") and 2-second mtime; video files
+  the SHA-256 from the copy (or "sample:..." with FULL_HASH_ON_COPY off).
+"""
+
+import os
+import re
+import sys
+import shutil
+import sqlite3
+import zipfile
+import argparse
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import backup_discovery as discovery
+from backup_copy import COPY_BUFFER_SIZE, CopyBackend
+from backup_store import BlobStore
+
+CATALOG_NAME = "catalog.sqlite"
+CATALOG_BATCH = 500   # rows per add_run transaction when a job records files as it goes
+DELETED_LIST = "_deleted.txt"   # in a delta zip: rel_paths deleted since the previous archive, one per line
+RUN_TIME_REGEX = re.compile(r"(\d{8}_\d{6})")
+BATCH_REGEX = re.compile(r"^\d{8}_\d{6}$")   # video batch folders
+
+# (rel_path, container, member, size, mtime, hash)
+FileRow = Tuple[str, Path, str, int, float, str | None]
+
+
+@dataclass
+class CatalogEntry:
+    rel_path: str
+    job: str
+    run: str
+    kind: str        # "zip", "batch" or "store"
+    container: Path  # zip part, batch folder or store root
+    member: str      # arcname in the zip, or path below the container
+    size: int
+    mtime: float
+    hash: str | None
+
+
+def run_time(name: str) -> float:
+    """Creation time encoded in a run / batch / snapshot name (YYYYMMDD_HHMMSS)."""
+    m = RUN_TIME_REGEX.search(name)
+    return datetime.strptime(m.group(1), "%Y%m%d_%H%M%S").timestamp() if m else 0.0
+
+
+def _like_literal(text: str) -> str:
+    """text for a LIKE ... ESCAPE '\\' pattern, with its own % and _ matched literally."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def zip_parts(folder: Path, stem: str) -> List[Path]:
+    """<stem>.zip or its <stem>.partNN.zip shards in folder."""
+    return sorted(p for p in folder.glob(f"{stem}*.zip")
+                  if p.name == f"{stem}.zip" or re.fullmatch(re.escape(stem) + r"\.part\d+\.zip", p.name))
+
+
+class Catalog:
+    """rel_path -> backed-up copies, across runs, jobs and destinations."""
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS runs ("
+        "run TEXT PRIMARY KEY, job TEXT NOT NULL, kind TEXT NOT NULL, created REAL NOT NULL, "
+        "files INTEGER NOT NULL DEFAULT 0, bytes INTEGER NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS files ("
+        "run TEXT NOT NULL, rel_path TEXT NOT NULL, container TEXT NOT NULL, member TEXT NOT NULL, "
+        "size INTEGER NOT NULL, mtime REAL NOT NULL, hash TEXT, PRIMARY KEY (run, rel_path))",
+        "CREATE INDEX IF NOT EXISTS files_rel_path ON files (rel_path)",
+        "CREATE TABLE IF NOT EXISTS deleted (run TEXT NOT NULL, rel_path TEXT NOT NULL, PRIMARY KEY (run, rel_path))",
+    ]
+    # columns added after the first release: a full run lists everything its job backs up,
+    # so older runs of that job do not contribute to restores from it onwards
+    EXTRA_COLUMNS = {"full": "INTEGER NOT NULL DEFAULT 0"}
+
+    def __init__(self, path: Path, conn: sqlite3.Connection):
+        self.path = path
+        self.root = path.parent   # containers are stored relative to this folder
+        self.conn = conn
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def open(path: Path, read_only: bool = False) -> "Catalog":
+        if read_only:
+            conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=60, check_same_thread=False)   # both jobs may finish at once
+            for stmt in Catalog.SCHEMA:
+                conn.execute(stmt)
+            have = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+            for name, decl in Catalog.EXTRA_COLUMNS.items():
+                if name not in have:
+                    conn.execute(f"ALTER TABLE runs ADD COLUMN {name} {decl}")
+            conn.commit()
+        return Catalog(path, conn)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _container(self, path: Path) -> str:
+        try:
+            return Path(os.path.relpath(path, self.root)).as_posix()
+        except ValueError:   # other drive
+            return str(path)
+
+    def resolve(self, container: str) -> Path:
+        return self.root / container
+
+    # ---- recording ----
+
+    def has_run(self, run: str) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM runs WHERE run = ?", (run,)).fetchone() is not None
+
+    def add_run(self, run: str, job: str, kind: str, files: Iterable[FileRow], created: float | None = None,
+                replace: bool = True, full: bool = False, deleted: Iterable[str] = ()) -> int:
+        """Record (or re-record) one run's files in a single transaction; returns the run's file
+           count. With replace=False the files are added to those already recorded for the run.
+           `full`: the run lists every file of its job (a baseline); `deleted`: rel_paths the
+           run saw removed since the previous one."""
+        created = run_time(run) if created is None else created
+        with self._lock, self.conn:
+            if replace:
+                self.conn.execute("DELETE FROM files WHERE run = ?", (run,))
+                self.conn.execute("DELETE FROM deleted WHERE run = ?", (run,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (run, rel_path, container, member, size, mtime, hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((run, rel, self._container(container), member, size, mtime, digest)
+                 for rel, container, member, size, mtime, digest in files))
+            self.conn.executemany("INSERT OR IGNORE INTO deleted (run, rel_path) VALUES (?, ?)",
+                                  ((run, rel) for rel in deleted))
+            n, nbytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files WHERE run = ?", (run,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO runs (run, job, kind, created, files, bytes, full) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?)", (run, job, kind, created, n, nbytes, int(full)))
+        return n
+
+    def add_zip(self, run: str, job: str, parts: Iterable[Path], created: float | None = None,
+                full: bool | None = None) -> int:
+        """Record archive parts from their central directories. Arcnames start with the
+           staging folder (backup_<ts>/...), which is not part of the rel_path. A delta's
+           DELETED_LIST member is read into deletions. `full` defaults to "not a *_delta run"."""
+        rows: List[FileRow] = []
+        deleted: List[str] = []
+        for part in parts:
+            with zipfile.ZipFile(part) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or '/' not in info.filename:
+                        continue
+                    rel = info.filename.split('/', 1)[1]
+                    if rel == DELETED_LIST:
+                        deleted.extend(zf.read(info).decode('utf-8').splitlines())
+                        continue
+                    mtime = datetime(*info.date_time).timestamp()
+                    rows.append((rel, part, info.filename, info.file_size, mtime, f"crc32:{info.CRC:08x}"))
+        if full is None:
+            full = not run.endswith("_delta")
+        return self.add_run(run, job, "zip", rows, created, full=full, deleted=deleted)
+
+    def add_batch(self, run: str, job: str, batch_dir: Path, created: float | None = None) -> int:
+        """Record a batch folder by listing it (for batches written before the catalog existed)."""
+        def _rows():
+            for entry in discovery.walk_files(batch_dir):
+                rel = Path(os.path.relpath(entry.path, batch_dir)).as_posix()
+                st = entry.stat()
+                yield rel, batch_dir, rel, st.st_size, st.st_mtime, None
+        return self.add_run(run, job, "batch", _rows(), created)
+
+    def add_snapshot(self, store: BlobStore, name: str, job: str, full: bool = False) -> int:
+        """Record the files a store snapshot lists itself (its parents are runs of their own).
+           full=True for snapshots that list every file of the job (data snapshots)."""
+        doc = store.read_snapshot(name)
+        created = datetime.fromisoformat(doc['created']).timestamp() if doc.get('created') else None
+        rows = ((e['path'], store.root, store.blob_path(e['hash']).relative_to(store.root).as_posix(),
+                 e['size'], e['mtime'], e['hash']) for e in doc['entries'])
+        return self.add_run(name, job, "store", rows, created, full=full)
+
+    # ---- queries ----
+
+    def runs(self) -> List[Tuple[str, str, str, float, int, int]]:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT run, job, kind, created, files, bytes FROM runs ORDER BY created, run").fetchall()
+
+    def as_of(self, when: str | None) -> float | None:
+        """Point in time from an ISO date/time or a run name; None = now."""
+        if not when:
+            return None
+        with self._lock:
+            hit = self.conn.execute("SELECT created FROM runs WHERE run = ?", (when,)).fetchone()
+        return hit[0] if hit else datetime.fromisoformat(when).timestamp()
+
+    def select(self, subject: str | None = None, experiment: str | None = None, pattern: str | None = None,
+               as_of: float | None = None, job: str | None = None) -> List[CatalogEntry]:
+        """Newest copy of every matching rel_path backed up at or before `as_of`.
+
+        Runs older than their job's latest full run (up to `as_of`) are ignored, and a
+        rel_path listed as deleted by a later run drops out, so a restore matches what
+        the source looked like at that time.
+        """
+        where, args = [], []
+        if subject:
+            where.append("('/' || f.rel_path) LIKE ? ESCAPE '\\'")
+            args.append(f"%/{_like_literal(subject)}/%")
+        if experiment:
+            where.append("f.rel_path LIKE ? ESCAPE '\\'")
+            args.append(f"{_like_literal(experiment)}/%")
+        if pattern:
+            where.append("f.rel_path GLOB ?")
+            args.append(pattern)
+        if as_of is not None:
+            where.append("r.created <= ?")
+            args.append(as_of)
+        if job:
+            where.append("r.job = ?")
+            args.append(job)
+        cond = (" WHERE " + " AND ".join(where)) if where else ""
+        # copies and deletions in run order; a deletion has no container (NULL)
+        sql = ("SELECT f.rel_path, r.job, f.run, r.kind, f.container, f.member, f.size, f.mtime, f.hash, r.created "
+               "FROM files f JOIN runs r ON r.run = f.run" + cond +
+               " UNION ALL SELECT f.rel_path, r.job, f.run, r.kind, NULL, NULL, 0, 0, NULL, r.created "
+               "FROM deleted f JOIN runs r ON r.run = f.run" + cond + " ORDER BY 10, 3")
+        baseline_sql = "SELECT job, MAX(created) FROM runs WHERE full = 1" + (
+            " AND created <= ?" if as_of is not None else "") + " GROUP BY job"
+        latest: Dict[str, CatalogEntry] = {}
+        with self._lock:
+            baseline = dict(self.conn.execute(baseline_sql, [as_of] if as_of is not None else []).fetchall())
+            for rel, job_, run, kind, container, member, size, mtime, digest, created in \
+                    self.conn.execute(sql, args + args):
+                if created < baseline.get(job_, created):
+                    continue
+                if container is None:
+                    latest.pop(rel, None)
+                else:
+                    latest[rel] = CatalogEntry(rel, job_, run, kind, self.resolve(container), member,
+                                               size, mtime, digest)
+        return [latest[rel] for rel in sorted(latest)]
+
+    # ---- restore ----
+
+    def restore(self, entries: Iterable[CatalogEntry], target: Path, link: bool = False,
+                copier: CopyBackend | None = None) -> Tuple[int, List[Tuple[str, str]]]:
+        """Write entries below target, opening each zip once and reading only the listed
+           members. With link=True store blobs are hardlinked where possible (see
+           BlobStore.restore). Returns (restored, [(rel_path, error)])."""
+        copier = copier or CopyBackend()
+        groups: Dict[Tuple[str, Path], List[CatalogEntry]] = {}
+        for e in entries:
+            groups.setdefault((e.kind, e.container), []).append(e)
+        n, failed = 0, []
+        for (kind, container), group in sorted(groups.items()):
+            if kind == "zip":
+                try:
+                    zf = zipfile.ZipFile(container)
+                except (OSError, zipfile.BadZipFile) as err:
+                    failed.extend((e.rel_path, str(err)) for e in group)
+                    continue
+            for e in group:
+                dst = target / e.rel_path
+                try:
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    if kind == "zip":
+                        with zf.open(e.member) as fsrc, dst.open('wb') as fdst:
+                            shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+                    elif link and kind == "store":
+                        dst.unlink(missing_ok=True)
+                        if copier.link(container / e.member, dst) == "hardlink":
+                            n += 1
+                            continue
+                    else:
+                        copier.copy(container / e.member, dst)
+                    os.utime(dst, (e.mtime, e.mtime))
+                    n += 1
+                except (OSError, KeyError, zipfile.BadZipFile) as err:
+                    failed.append((e.rel_path, str(err)))
+            if kind == "zip":
+                zf.close()
+        return n, failed
+
+
+def index_existing(catalog: Catalog, data_dir: Path | None = None, video_dir: Path | None = None,
+                   store_root: Path | None = None, reindex: bool = False) -> Dict[str, int]:
+    """Add runs written before the catalog existed (or all of them, with reindex)."""
+    added = {'data': 0, 'video': 0, 'store': 0}
+    if data_dir is not None and data_dir.is_dir():
+        stems = {p.name.split('.')[0] for p in data_dir.glob("backup_*.zip")}
+        for stem in sorted(stems):
+            if reindex or not catalog.has_run(stem):
+                catalog.add_zip(stem, "data", zip_parts(data_dir, stem))
+                added['data'] += 1
+    if video_dir is not None and video_dir.is_dir():
+        for batch in discovery.list_dirs(video_dir, BATCH_REGEX):
+            run = f"video_{batch.name}"
+            if reindex or not catalog.has_run(run):
+                catalog.add_batch(run, "video", batch)
+                added['video'] += 1
+    if store_root is not None and (store_root / "store_index.sqlite").exists():
+        store = BlobStore(store_root)
+        for name in store.list_snapshots():
+            if reindex or not catalog.has_run(name):
+                job = name.split('_', 1)[0]
+                full = job == "data" and store.read_snapshot(name).get('parent') is None
+                catalog.add_snapshot(store, name, job, full)
+                added['store'] += 1
+        store.close()
+    return added
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Find and restore backed-up files through the catalog.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_index = sub.add_parser("index", help="add existing zips, batch folders and snapshots")
+    p_index.add_argument("catalog", type=Path)
+    p_index.add_argument("--data-dir", type=Path, help="folder with backup_*.zip")
+    p_index.add_argument("--video-dir", type=Path, help="folder with YYYYMMDD_HHMMSS batch folders")
+    p_index.add_argument("--store", type=Path, help="dedup store root")
+    p_index.add_argument("--reindex", action="store_true", help="re-read runs already in the catalog")
+    p_runs = sub.add_parser("runs", help="list recorded runs")
+    p_runs.add_argument("catalog", type=Path)
+    p_find = sub.add_parser("find", help="list the newest copy of matching files")
+    p_find.add_argument("catalog", type=Path)
+    p_restore = sub.add_parser("restore", help="restore matching files into a folder")
+    p_restore.add_argument("catalog", type=Path)
+    p_restore.add_argument("target", type=Path)
+    p_restore.add_argument("--link", action="store_true",
+                           help="hardlink store blobs instead of copying (same volume; do not edit restored files)")
+    for p in (p_find, p_restore):
+        p.add_argument("--subject", help="e.g. __20160225_17406")
+        p.add_argument("--experiment", help="e.g. experiment_12")
+        p.add_argument("--path", help="glob on the rel_path, e.g. '*/derived/*.mat'")
+        p.add_argument("--as-of", help="ISO date/time or run name (default: latest)")
+        p.add_argument("--job", choices=["data", "video"])
+    args = ap.parse_args()
+
+    if args.cmd != "index" and not args.catalog.exists():
+        print(f"[ERROR] No catalog at {args.catalog}")
+        sys.exit(1)
+    catalog = Catalog.open(args.catalog, read_only=args.cmd in ("runs", "find"))
+    if args.cmd == "index":
+        added = index_existing(catalog, args.data_dir, args.video_dir, args.store, args.reindex)
+        print(f"[INFO] Indexed {added['data']} zip runs, {added['video']} batches, {added['store']} snapshots")
+    elif args.cmd == "runs":
+        for run, job, kind, created, files, nbytes in catalog.runs():
+            print(f"{run:40s} {job:6s} {kind:6s} {datetime.fromtimestamp(created):%Y-%m-%d %H:%M}  "
+                  f"{files:8d} files {nbytes / 1e9:8.2f} GB")
+    else:
+        if not (args.subject or args.experiment or args.path or args.as_of):
+            print("[ERROR] Give at least one of --subject, --experiment, --path, --as-of")
+            sys.exit(1)
+        try:
+            as_of = catalog.as_of(args.as_of)
+        except ValueError:
+            print(f"[ERROR] --as-of is neither a run nor an ISO date/time: {args.as_of}")
+            sys.exit(1)
+        entries = catalog.select(args.subject, args.experiment, args.path, as_of, args.job)
+        if args.cmd == "find":
+            for e in entries:
+                print(f"{e.rel_path}  {e.size}  {e.run}  {catalog._container(e.container)}")
+            print(f"[INFO] {len(entries)} files, {sum(e.size for e in entries) / 1e9:.2f} GB "
+                  f"in {len({e.container for e in entries})} containers")
+        else:
+            copier = CopyBackend()
+            n, failed = catalog.restore(entries, args.target, args.link, copier)
+            for rel, err in failed:
+                print(f"[WARN] {rel}: {err}")
+            print(f"[INFO] Restored {n}/{len(entries)} files into {args.target} ({copier.summary()})")
+            if failed:
+                catalog.close()
+                sys.exit(2)
+    catalog.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+COPY BACKEND shared by the scheduled backup scripts.
+- copy() moves a file's bytes with the fastest mechanism that works for the
+  (source volume, destination volume) pair, then copies metadata like shutil.copy2:
+    reflink          FICLONE clone on copy-on-write filesystems (btrfs, XFS), same volume
+    copy_file_range  in-kernel copy, no user-space buffers (Linux)
+    sendfile         in-kernel copy for kernels/filesystems without copy_file_range
+    readinto         large reused per-thread buffer; works everywhere
+  A mechanism that fails with a "not supported here" error, or whose first call
+  copies nothing although the source has bytes left (some FUSE/CIFS mounts), is
+  not tried again for that volume pair; real I/O errors are raised as usual, and
+  a copy that ends short of the source size raises instead of leaving a
+  truncated file.
+- copy_range() copies the next N bytes between open files, for chunked or resumable
+  copies; a `tap` sees every byte (e.g. a hasher), which forces the readinto path.
+- link() hardlinks content that is never modified in place (dedup-store blobs).
+- Files and bytes per mechanism are counted for the run report.
+"""
+
+import os
+import sys
+import errno
+import shutil
+import threading
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+KERNEL_CHUNK     = 1 << 30   # max bytes per copy_file_range / sendfile call
+FICLONE          = 0x40049409  # linux/fs.h
+
+STRATEGIES = ("reflink", "copy_file_range", "sendfile", "readinto")
+
+# errno values meaning "this mechanism does not work for these files", not an I/O failure
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EBADF,
+                errno.EOPNOTSUPP, getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)}
+
+
+def available_strategies() -> Tuple[str, ...]:
+    linux = sys.platform.startswith("linux")
+    have = {
+        "reflink": linux and fcntl is not None,
+        "copy_file_range": hasattr(os, "copy_file_range"),
+        "sendfile": linux and hasattr(os, "sendfile"),
+        "readinto": True,
+    }
+    return tuple(s for s in STRATEGIES if have[s])
+
+
+def _check_eof(fsrc: BinaryIO, strategy: str):
+    """A first in-kernel call returned 0: fine at end of file, otherwise the filesystem
+       does not really support the call (raised as ENOTSUP so the next mechanism runs)."""
+    if fsrc.tell() < os.fstat(fsrc.fileno()).st_size:
+        raise OSError(errno.EOPNOTSUPP, f"{strategy} copied nothing before end of file")
+
+
+class CopyBackend:
+    """Per-volume-pair choice of copy mechanism. Safe to share between worker threads."""
+
+    def __init__(self, strategies: Tuple[str, ...] | None = None, buffer_size: int = COPY_BUFFER_SIZE):
+        allowed = available_strategies()
+        self.strategies = tuple(s for s in (strategies or allowed) if s in allowed)
+        if "readinto" not in self.strategies:
+            self.strategies += ("readinto",)   # the fallback is always there
+        self.buffer_size = buffer_size
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self._unsupported: Set[Tuple[Tuple[int, int], str]] = set()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # ---- public API ----
+
+    def copy(self, src: Path | str, dst: Path | str) -> str:
+        """Copy data and metadata (like shutil.copy2); return the mechanism used."""
+        with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb', buffering=0) as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            strategy = self._transfer(fsrc, fdst, size, whole=True)
+            if fdst.tell() != size:
+                raise OSError(errno.EIO, f"short copy ({strategy}): {fdst.tell()} of {size} bytes", str(src))
+        shutil.copystat(src, dst)
+        self.record(strategy, size)
+        return strategy
+
+    def copy_range(self, fsrc: BinaryIO, fdst: BinaryIO, count: int,
+                   tap: Callable[[memoryview], object] | None = None) -> str:
+        """Copy `count` bytes from fsrc's position to fdst's, advancing both. Both must be
+           unbuffered (buffering=0). Counting the file is left to the caller (record())."""
+        return self._transfer(fsrc, fdst, count, whole=False, tap=tap)
+
+    def link(self, src: Path | str, dst: Path | str) -> str:
+        """Hardlink src at dst if both are on one volume, else copy(). Both names then share
+           one inode, so only use this for content nobody edits in place."""
+        try:
+            os.link(src, dst)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED | {errno.EMLINK, errno.EPERM}:
+                raise
+            return self.copy(src, dst)
+        self.record("hardlink", os.stat(dst).st_size)
+        return "hardlink"
+
+    def record(self, strategy: str, nbytes: int, files: int = 1):
+        with self._lock:
+            c = self.counts.setdefault(strategy, {'files': 0, 'bytes': 0})
+            c['files'] += files
+            c['bytes'] += nbytes
+
+    def report(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {s: dict(c) for s, c in self.counts.items()}
+
+    def summary(self) -> str:
+        return ", ".join(f"{s} {c['files']} files {c['bytes'] / 1e9:.2f} GB"
+                         for s, c in self.report().items()) or "no files copied"
+
+    # ---- mechanisms ----
+
+    def _transfer(self, fsrc: BinaryIO, fdst: BinaryIO, count: int, whole: bool,
+                  tap: Callable[[memoryview], object] | None = None) -> str:
+        key = (os.fstat(fsrc.fileno()).st_dev, os.fstat(fdst.fileno()).st_dev)
+        start_src, start_dst = fsrc.tell(), fdst.tell()
+        for strategy in self._candidates(key, whole, tap is not None):
+            try:
+                getattr(self, f"_{strategy}")(fsrc, fdst, count, tap)
+                return strategy
+            except OSError as e:
+                if strategy == "readinto" or e.errno not in _UNSUPPORTED:
+                    raise
+                with self._lock:
+                    self._unsupported.add((key, strategy))
+                fsrc.seek(start_src)   # undo a partial attempt before the next mechanism
+                fdst.seek(start_dst)
+                fdst.truncate(start_dst)
+        raise AssertionError("readinto always applies")
+
+    def _candidates(self, key: Tuple[int, int], whole: bool, tapped: bool):
+        for strategy in self.strategies:
+            if tapped and strategy != "readinto":
+                continue   # only the buffered path sees the bytes
+            if strategy == "reflink" and not (whole and key[0] == key[1]):
+                continue
+            with self._lock:
+                if (key, strategy) in self._unsupported:
+                    continue
+            yield strategy
+
+    def _reflink(self, fsrc: BinaryIO, fdst: BinaryIO, count: int, tap=None):
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        fsrc.seek(count, os.SEEK_CUR)
+        fdst.seek(count, os.SEEK_CUR)
+
+    def _copy_file_range(self, fsrc: BinaryIO, fdst: BinaryIO, count: int, tap=None):
+        first = True
+        while count > 0:
+            n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(count, KERNEL_CHUNK))
+            if n == 0:
+                if first:
+                    _check_eof(fsrc, "copy_file_range")
+                break   # source shorter than expected
+            first = False
+            count -= n
+
+    def _sendfile(self, fsrc: BinaryIO, fdst: BinaryIO, count: int, tap=None):
+        first = True
+        while count > 0:
+            n = os.sendfile(fdst.fileno(), fsrc.fileno(), None, min(count, KERNEL_CHUNK))
+            if n == 0:
+                if first:
+                    _check_eof(fsrc, "sendfile")
+                break
+            first = False
+            count -= n
+
+    def _readinto(self, fsrc: BinaryIO, fdst: BinaryIO, count: int, tap=None):
+        buf = getattr(self._local, "buf", None)
+        if buf is None:
+            buf = self._local.buf = bytearray(self.buffer_size)
+        view = memoryview(buf)
+        while count > 0:
+            n = fsrc.readinto(view[:min(count, len(buf))])
+            if not n:
+                break
+            chunk = view[:n]
+            while chunk:   # raw files may write short
+                chunk = chunk[fdst.write(chunk):]
+            if tap is not None:
+                tap(view[:n])
+            count -= n
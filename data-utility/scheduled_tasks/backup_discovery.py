@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SHARED TREE DISCOVERY for the scheduled backup scripts.
+- Lists directories with os.scandir, so file/dir checks use the cached d_type
+  (and on Windows the cached stat data) instead of one stat round-trip per entry.
+- Fans experiment/subject listing out over a thread pool, so per-call latency on
+  the network share overlaps instead of adding up.
+- Results are streamed as they complete, so callers can start work before the
+  whole tree has been scanned.
+- File selection uses a Matcher: include/exclude rules (extensions or globs)
+  compiled once, then applied to each entry name in a single pass.
+- Jobs list the source through a tree object: LIVE (this module, on the real file
+  system) or a backup_inventory.Inventory answering the same calls from one shared scan.
+"""
+
+import os
+import re
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Tuple, TypeVar
+
+EXP_REGEX      = re.compile(r"^experiment_\d{2,3}$", re.IGNORECASE)
+SUBJ_REGEX     = re.compile(r"^__\d{8}_\d+$")              # e.g., __20160225_17406
+CAM_DIR_REGEX  = re.compile(r"^cam\d{2}_video_r$", re.IGNORECASE)
+
+SCAN_WORKERS   = 8      # concurrent directory listings
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def norm_exts(exts: Iterable[str]) -> Tuple[str, ...]:
+    """Lower-case extensions with a leading dot, as a tuple usable by str.endswith."""
+    return tuple(e.lower() if e.startswith('.') else f".{e.lower()}" for e in exts)
+
+
+class Matcher:
+    """Case-insensitive include/exclude rules for file names, compiled once.
+
+    A rule containing '*', '?' or '[' is a glob on the whole name (e.g.
+    '*boxes_face.mat'); anything else is an extension ('.txt' or 'txt').
+    include=None accepts every name; exclude wins over include.
+    """
+
+    def __init__(self, include: Iterable[str] | None = None, exclude: Iterable[str] = ()):
+        self.include = None if include is None else list(include)
+        self.exclude = list(exclude)
+        self.inc_exts, self.inc_glob = self._compile(self.include or ())
+        self.exc_exts, self.exc_glob = self._compile(self.exclude)
+
+    @staticmethod
+    def _compile(rules: Iterable[str]) -> Tuple[Tuple[str, ...], re.Pattern | None]:
+        globs = [r.lower() for r in rules if any(c in r for c in "*?[")]
+        exts = norm_exts(r for r in rules if not any(c in r for c in "*?["))
+        pattern = re.compile("|".join(fnmatch.translate(g) for g in globs)) if globs else None
+        return exts, pattern
+
+    def __call__(self, name: str) -> bool:
+        low = name.lower()
+        if low.endswith(self.exc_exts) or (self.exc_glob is not None and self.exc_glob.match(low)):
+            return False
+        if self.include is None:
+            return True
+        return low.endswith(self.inc_exts) or (self.inc_glob is not None and self.inc_glob.match(low) is not None)
+
+    def describe(self) -> str:
+        inc = "*" if self.include is None else ", ".join(self.include)
+        return inc + (f" (excluding {', '.join(self.exclude)})" if self.exclude else "")
+
+
+def list_dirs(path: Path, pattern: re.Pattern | None = None) -> List[Path]:
+    """Sub-directories of path whose name matches pattern (all if None)."""
+    with os.scandir(path) as it:
+        return [Path(e.path) for e in it
+                if e.is_dir() and (pattern is None or pattern.match(e.name))]
+
+
+def list_files(path: Path, match: Matcher | None = None) -> List[os.DirEntry]:
+    """Regular files directly in path, optionally filtered by a Matcher."""
+    with os.scandir(path) as it:
+        return [e for e in it
+                if e.is_file() and (match is None or match(e.name))]
+
+
+def walk_files(root: Path, match: Matcher | None = None,
+               subdirs: List[Path] | None = None) -> Iterator[os.DirEntry]:
+    """Recursively yield file entries below root, optionally filtered by a Matcher.
+       Directories found below root are appended to `subdirs` if given."""
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir():
+                    stack.append(e.path)
+                    if subdirs is not None:
+                        subdirs.append(Path(e.path))
+                elif e.is_file() and (match is None or match(e.name)):
+                    yield e
+
+
+def rel_posix(entry_path: str, root: Path) -> str:
+    """Path of a scandir entry relative to root, with forward slashes."""
+    return Path(os.path.relpath(entry_path, root)).as_posix()
+
+
+class LiveTree:
+    """Listing calls used by the jobs, answered from the file system.
+       backup_inventory.Inventory provides the same methods from a saved scan."""
+
+    def list_dirs(self, path: Path, pattern: re.Pattern | None = None) -> List[Path]:
+        return list_dirs(path, pattern)
+
+    def list_files(self, path: Path, match: Matcher | None = None) -> List[os.DirEntry]:
+        return list_files(path, match)
+
+    def walk_files(self, root: Path, match: Matcher | None = None,
+                   subdirs: List[Path] | None = None) -> Iterator[os.DirEntry]:
+        return walk_files(root, match, subdirs)
+
+    def stat(self, path: Path) -> os.stat_result:
+        return os.stat(path)
+
+    def is_dir(self, path: Path) -> bool:
+        return os.path.isdir(path)
+
+    def is_file(self, path: Path) -> bool:
+        return os.path.isfile(path)
+
+
+LIVE = LiveTree()
+
+
+def discover_experiments(root: Path, pattern: re.Pattern = EXP_REGEX, tree: LiveTree = LIVE) -> List[Path]:
+    return tree.list_dirs(root, pattern)
+
+
+def discover_subjects(exp_dir: Path, pattern: re.Pattern = SUBJ_REGEX, fallback: bool = True,
+                      tree: LiveTree = LIVE) -> List[Path]:
+    """Find subject dirs under exp_dir/included. With fallback=True, look directly
+       under exp_dir when there is no 'included' folder; otherwise that raises."""
+    try:
+        return tree.list_dirs(exp_dir / "included", pattern)
+    except (FileNotFoundError, NotADirectoryError):
+        if not fallback:
+            raise
+    return tree.list_dirs(exp_dir, pattern)
+
+
+def stream_map(fn: Callable[[T], R], items: Iterable[T],
+               workers: int = SCAN_WORKERS) -> Iterator[Tuple[T, R | None, BaseException | None]]:
+    """Run fn over items on a thread pool, yielding (item, result, error) as each completes.
+
+    Items are pulled lazily with at most 2*workers in flight, so `items` may itself be
+    a stream and the caller can act on early results while later ones are still running.
+    """
+    it = iter(items)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = {}
+
+        def _submit_next() -> bool:
+            for item in it:
+                pending[pool.submit(fn, item)] = item
+                return True
+            return False
+
+        for _ in range(2 * max(1, workers)):
+            if not _submit_next():
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item = pending.pop(fut)
+                _submit_next()
+                err = fut.exception()
+                yield item, (None if err else fut.result()), err
+
+
+def iter_subjects(root: Path, workers: int = SCAN_WORKERS,
+                  exp_pattern: re.Pattern = EXP_REGEX, subj_pattern: re.Pattern = SUBJ_REGEX,
+                  fallback: bool = True,
+                  tree: LiveTree = LIVE) -> Iterator[Tuple[Path, List[Path] | None, BaseException | None]]:
+    """Yield (exp_dir, subjects, error) for every experiment under root, listing experiments concurrently."""
+    experiments = discover_experiments(root, exp_pattern, tree)
+    yield from stream_map(lambda exp: discover_subjects(exp, subj_pattern, fallback, tree), experiments, workers)
@@ -2,94 +2,416 @@
 # -*- coding: utf-8 -*-
 
 import os
-import re
 import sys
+import time
+import heapq
 import shutil
+import threading
 import zipfile
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Iterable, List
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import backup_discovery as discovery
+from backup_manifest import Manifest
+from backup_store import BlobStore, SnapshotWriter
+from backup_metrics import SLOWEST_FILES, PhaseStats, RunMetrics
+from backup_logging import DirTally, RunLog, file_event, get_logger
+from backup_copy import CopyBackend
+from backup_catalog import DELETED_LIST, Catalog, zip_parts
+from backup_inventory import Inventory
 
 # --------------------------
 # Logging
 # --------------------------
 
-def setup_logger(log_path: Path | None, verbose: bool) -> logging.Logger:
-    logger = logging.getLogger("backup")
-    logger.setLevel(logging.DEBUG)
-    logger.handlers.clear()
-
-    fmt = logging.Formatter("%(message)s")
-    if log_path is None:
-        sh = logging.StreamHandler(sys.stdout)
-        sh.setLevel(logging.DEBUG if verbose else logging.INFO)
-        sh.setFormatter(fmt)
-        logger.addHandler(sh)
-    else:
-        fh = logging.FileHandler(log_path, encoding="utf-8")
-        fh.setLevel(logging.DEBUG)
-        fh.setFormatter(fmt)
-        logger.addHandler(fh)
-        if verbose:
-            sh = logging.StreamHandler(sys.stdout)
-            sh.setLevel(logging.DEBUG)
-            sh.setFormatter(fmt)
-            logger.addHandler(sh)
-    return logger
+# Shared "backup" logger (backup_logging). main() routes it through a RunLog: a
+# background queue writing to a local file, per-directory summaries at INFO and
+# a per-file JSONL side log, published next to the archives at the end.
+logger = get_logger()
+
+# --------------------------
+# Incremental selection
+# --------------------------
+
+class DeltaSelector:
+    """
+    Decides which files go into an incremental (delta) archive.
+
+    Files are keyed by their path relative to the staging root, i.e. the same
+    path they get inside the zip, and compared by size/mtime against a
+    persistent Manifest. Selected files are only recorded in the manifest by
+    commit(), once the archive has been written successfully. With full=True
+    every file is selected, producing a new baseline.
+
+    Every file offered is remembered, so deleted() can list manifest rows
+    whose source is gone; a delta archive carries that list (DELETED_LIST)
+    so a restore of baseline + deltas does not bring deleted files back.
+    """
+
+    def __init__(self, manifest: Manifest, stage_root: Path, full: bool):
+        self.manifest = manifest
+        self.stage_root = stage_root
+        self.full = full
+        self.pending: Dict[str, Tuple[int, float]] = {}
+        self.seen: set[str] = set()
+        self.removed: List[str] = []
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def wants(self, src: Path, dst: Path, st: os.stat_result | None = None) -> bool:
+        rel = dst.relative_to(self.stage_root).as_posix()
+        st = st or src.stat()
+        with self._lock:
+            self.seen.add(rel)
+        if self.full or self.manifest.needs_copy(rel, st.st_size, st.st_mtime):
+            with self._lock:
+                self.pending[rel] = (st.st_size, st.st_mtime)
+            return True
+        with self._lock:
+            self.skipped += 1
+        return False
+
+    def discard(self, dst: Path):
+        """Forget a selected file that did not make it into the archive."""
+        with self._lock:
+            self.pending.pop(dst.relative_to(self.stage_root).as_posix(), None)
+
+    def deleted(self, incomplete: Iterable[str] = ()) -> List[str]:
+        """Manifest rows not offered this run, in folders that were listed this run.
+
+        Only folders where at least one file was seen count as listed, so a folder
+        that failed to list (or vanished whole) is not reported; prefixes in
+        `incomplete` (e.g. failed 'experiment/subject' ids) are skipped too. A
+        folder removed entirely drops out at the next full baseline instead.
+        """
+        listed = {rel.rsplit('/', 1)[0] for rel in self.seen}
+        skip = tuple(p.rstrip('/') + '/' for p in incomplete)
+        self.removed = sorted(
+            rel for (rel,) in self.manifest.conn.execute("SELECT rel_path FROM manifest")
+            if rel not in self.seen and rel.rsplit('/', 1)[0] in listed and not rel.startswith(skip))
+        return self.removed
+
+    def commit(self):
+        self.manifest.delete(self.removed)
+        for rel, (size, mtime) in self.pending.items():
+            self.manifest.upsert(rel, size, mtime)
+        if self.full:
+            self.manifest.set_meta('last_full_backup', str(time.time()))
+        self.manifest.save()
+
+# --------------------------
+# Direct-to-archive writer
+# --------------------------
+
+ZIP_LEVEL = 6   # deflate level for compressible members
+# already-compressed types, stored as-is instead of burning CPU on deflate
+STORED_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.mat', '.xlsx', '.zip', '.gz',
+               '.mp4', '.avi', '.mov', '.mkv', '.m4v')
+MIN_SHARD_BYTES = 64 * 1024 * 1024   # smaller archives are not worth another process and zip part
+
+def _member_compression(arcname: str, stored_exts: Tuple[str, ...]) -> int:
+    return zipfile.ZIP_STORED if arcname.lower().endswith(stored_exts) else zipfile.ZIP_DEFLATED
+
+def _write_shard(zip_path: str, items: List[Tuple[str, str]], level: int,
+                 stored_exts: Tuple[str, ...], texts: Dict[str, str] | None = None
+                 ) -> Tuple[List[Tuple[str, str]], List[Tuple[float, str, int]]]:
+    """Write one archive shard (runs in a worker process). Returns (arcname, error) for
+       failures and the slowest members as (seconds to read+compress+write, arcname, bytes)."""
+    failed, times = [], []
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=level) as zf:
+        for arcname, text in (texts or {}).items():
+            zf.writestr(arcname, text)
+        for src, arcname in items:
+            t0 = time.monotonic()
+            try:
+                zf.write(src, arcname, compress_type=_member_compression(arcname, stored_exts))
+            except OSError as e:
+                failed.append((arcname, str(e)))
+                continue
+            times.append((time.monotonic() - t0, arcname, zf.getinfo(arcname).file_size))
+    return failed, heapq.nlargest(SLOWEST_FILES, times)
+
+class ArchiveWriter:
+    """
+    Collects backup files and writes them straight from the source into a zip
+    on the destination, instead of copying them into a staging folder and
+    zipping that afterwards.
+
+    Callers keep computing destination paths under a (never created) staging
+    root; put() maps them to the same arcnames zip_move_cleanup would have
+    used (relative to root.parent). close() compresses: with shards > 1 the
+    files are balanced by size over <name>.partNN.zip shards, each written by
+    its own process, so deflate runs on several cores. Small runs use fewer
+    shards (at most one per file and per MIN_SHARD_BYTES, never an empty
+    part), down to a single <name>.zip. Members whose
+    extension is in stored_exts are stored uncompressed. Every shard is
+    written as *.zip.tmp and renamed into place once complete.
+    """
+
+    def __init__(self, zip_path: Path, root: Path, shards: int = 1, level: int = ZIP_LEVEL,
+                 stored_exts: Tuple[str, ...] = STORED_EXTS):
+        self.final_path = zip_path
+        self.root = root
+        self.shards = max(1, shards)
+        self.level = level
+        self.stored_exts = tuple(e.lower() for e in stored_exts)
+        self.count = 0
+        self.failed: List[Path] = []   # dst paths that could not be archived
+        self._items: Dict[str, Tuple[Path, Path, int]] = {}   # arcname -> (src, dst, size)
+        self._texts: Dict[str, str] = {}   # generated members (arcname -> content), go into the first shard
+        self._lock = threading.Lock()
+
+    def put(self, src: Path, dst: Path, size: int | None = None):
+        arcname = dst.relative_to(self.root.parent).as_posix()
+        if size is None:
+            size = src.stat().st_size
+        with self._lock:
+            if arcname in self._items:
+                return
+            self._items[arcname] = (src, dst, size)
+            self.count += 1
+
+    def put_text(self, dst: Path, text: str):
+        """Add a generated member (e.g. the DELETED_LIST) at dst's arcname."""
+        with self._lock:
+            self._texts[dst.relative_to(self.root.parent).as_posix()] = text
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for _, _, size in self._items.values())
+
+    def _shard_paths(self, n: int) -> List[Path]:
+        if n == 1:
+            return [self.final_path]
+        stem = self.final_path.stem
+        return [self.final_path.with_name(f"{stem}.part{i + 1:02d}.zip") for i in range(n)]
+
+    @staticmethod
+    def _tmp(path: Path) -> Path:
+        return path.with_name(path.name + ".tmp")
+
+    def close(self, stats: PhaseStats | None = None) -> List[Path]:
+        """Write the shard(s) and return their final paths. The slowest members, timed in
+           the shard workers, go into `stats` (files and bytes are left to the caller)."""
+        n = max(1, min(self.shards, len(self._items), -(-self.total_bytes // MIN_SHARD_BYTES)))
+        # largest first onto the lightest shard, so shards finish together
+        buckets: List[List[Tuple[str, str]]] = [[] for _ in range(n)]
+        loads = [0] * n
+        for arcname, (src, _, size) in sorted(self._items.items(), key=lambda kv: -kv[1][2]):
+            k = loads.index(min(loads))
+            buckets[k].append((str(src), arcname))
+            loads[k] += size
+        buckets = [b for b in buckets if b] or [[]]   # empty files can leave a shard unused
+        n = len(buckets)
+        paths = self._shard_paths(n)
+        tmps = [str(self._tmp(p)) for p in paths]
+        self.final_path.parent.mkdir(parents=True, exist_ok=True)
+        if n == 1:
+            results = [_write_shard(tmps[0], buckets[0], self.level, self.stored_exts, self._texts)]
+        else:
+            with ProcessPoolExecutor(max_workers=n) as pool:
+                results = list(pool.map(_write_shard, tmps, buckets, [self.level] * n, [self.stored_exts] * n,
+                                        [self._texts] + [None] * (n - 1)))
+        for failed, times in results:
+            for seconds, arcname, nbytes in times:
+                if stats is not None:
+                    stats.add_time(arcname, nbytes, seconds)
+            for arcname, err in failed:
+                src, dst, _ = self._items[arcname]
+                file_event(logger, "error", src, arcname, error=f"could not archive: {err}")
+                self.failed.append(dst)
+        self.count -= len(self.failed)
+        for tmp, path in zip(tmps, paths):
+            os.replace(tmp, path)
+        return paths
+
+    def abort(self):
+        for p in self._shard_paths(1) + self._shard_paths(self.shards):
+            self._tmp(p).unlink(missing_ok=True)
 
 # --------------------------
 # Core copy helpers
 # --------------------------
 
+# staged copies go through one backend per run: in-kernel or reflink copies where the
+# volumes allow it, a large reused buffer otherwise; main() reports what was used
+copier = CopyBackend()
+
 @dataclass
 class BackupOptions:
+    # include rules: extensions ('.csv') or name globs ('*_summary.txt'), case-insensitive
     extensions: Iterable[str] = field(default_factory=lambda: ['.txt', '.png', '.jpg', '.csv', '.xlsx'])
+    exclude: Iterable[str] = field(default_factory=list)   # same rule syntax; wins over extensions
     overwrite: bool = True
     dry_run: bool = False
     verbose: bool = True
     target_subfolders: Iterable[str] = field(default_factory=lambda: ['stimuli_images', 'survey_data', 'MCDI'])
+    delta: DeltaSelector | None = None     # incremental mode: skip files unchanged since last archive
+    archive: ArchiveWriter | None = None   # direct-to-archive mode: no staging folder is written
+    stats: PhaseStats | None = None        # metrics for this step (files, bytes, stat calls, errors)
+    tree: discovery.LiveTree = discovery.LIVE   # source listings: live, or a shared Inventory
 
-def _norm_exts(exts: Iterable[str]) -> List[str]:
-    return [e.lower() if e.startswith('.') else f".{e.lower()}" for e in exts]
+MTIME_SLACK = 2.0   # seconds; FAT/SMB round timestamps, so copy2'd files can differ slightly
 
-def _copy_file(src: Path, dst: Path, opts: BackupOptions, log: logging.Logger):
-    if dst.exists() and not opts.overwrite:
-        log.info(f"SKIP (exists): {dst}")
-        return
-    if opts.dry_run:
-        log.info(f"COPY: {src}  -->  {dst}")
-        return
-    dst.parent.mkdir(parents=True, exist_ok=True)
+def _same_file(src_st: os.stat_result, dst_st: os.stat_result) -> bool:
+    return src_st.st_size == dst_st.st_size and abs(src_st.st_mtime - dst_st.st_mtime) <= MTIME_SLACK
+
+@dataclass
+class SyncResult:
+    copied: int = 0      # files handed to the copy callback
+    unchanged: int = 0
+    deleted: int = 0
+
+def _list_tree(root: Path, match: discovery.Matcher | None, subdirs: List[Path] | None = None,
+               tree: discovery.LiveTree = discovery.LIVE, recursive: bool = True) -> Dict[str, os.DirEntry]:
     try:
-        shutil.copy2(src, dst)
-        log.info(f"COPIED: {src}  -->  {dst}")
+        if not recursive:
+            return {e.name: e for e in tree.list_files(root, match)}
+        return {discovery.rel_posix(e.path, root): e for e in tree.walk_files(root, match, subdirs)}
+    except (FileNotFoundError, NotADirectoryError):
+        return {}
+
+def sync_tree(src_root: Path, dst_root: Path, copy: Callable[[Path, Path, os.stat_result], object],
+              match: discovery.Matcher | None = None, delete: bool = True,
+              stats: PhaseStats | None = None, tally: DirTally | None = None,
+              tree: discovery.LiveTree = discovery.LIVE, recursive: bool = True) -> SyncResult:
+    """
+    Make dst_root mirror the files below src_root (those accepted by `match`, if given;
+    only its direct files with recursive=False).
+    Both trees are listed once; files whose size and mtime already agree are left alone,
+    the rest are passed to copy(src, dst, src_stat). With delete=True, matching destination
+    files without a source are removed, and so are directories left empty by that. Against a
+    persistent staging folder an unchanged tree costs two listings and no writes.
+    The source side is listed through `tree`; the destination is always live.
+    """
+    stats = stats or PhaseStats("unused")
+    tally = tally or DirTally()
+    res = SyncResult()
+    src_dirs: List[Path] = []
+    dst_dirs: List[Path] = []
+    src_files = _list_tree(src_root, match, src_dirs, tree, recursive)
+    dst_files = _list_tree(dst_root, match, dst_dirs, recursive=recursive)
+    stats.add_stats(len(src_files) + len(dst_files))
+
+    for rel, entry in src_files.items():
+        st = entry.stat()
+        have = dst_files.get(rel)
+        if have is not None and _same_file(st, have.stat()):
+            res.unchanged += 1
+            tally.add(os.path.dirname(entry.path), "unchanged")
+            continue
+        copy(Path(entry.path), dst_root / rel, st)
+        res.copied += 1
+
+    if delete:
+        for rel in dst_files.keys() - src_files.keys():
+            os.remove(dst_files[rel].path)
+            res.deleted += 1
+            file_event(logger, "deleted", dst_files[rel].path)
+            tally.add(os.path.dirname(dst_files[rel].path), "deleted")
+        keep = {d.relative_to(src_root) for d in src_dirs}
+        for d in sorted(dst_dirs, key=lambda p: -len(p.parts)):   # deepest first
+            if d.relative_to(dst_root) in keep:
+                continue
+            try:
+                d.rmdir()   # only succeeds once empty
+            except OSError:
+                pass
+    return res
+
+def _copy_seconds(t0: float, archive: ArchiveWriter | SnapshotWriter | None) -> float | None:
+    """Per-file time since t0, or None for an ArchiveWriter: its put() only queues the
+       file, and the shard workers time the real read/compress/write (zip phase)."""
+    return None if isinstance(archive, ArchiveWriter) else time.monotonic() - t0
+
+def _copy_file(src: Path, dst: Path, opts: BackupOptions, log: logging.Logger,
+               st: os.stat_result | None = None, tally: DirTally | None = None) -> str:
+    """Copy one file and return its outcome; `st` is src's stat if the caller already
+       has it (e.g. from scandir). Each file is one JSONL event and one tally count."""
+    stats = opts.stats or PhaseStats("unused")
+    tally = tally or DirTally()
+    outcome, size, seconds, error = "copied", None, None, None
+    try:
+        if opts.archive is None:
+            stats.add_stats()
+            try:
+                dst_st = dst.stat()
+            except FileNotFoundError:
+                dst_st = None
+            if dst_st is not None and not opts.overwrite:
+                outcome = "skip_exists"
+            elif dst_st is not None:
+                if st is None:
+                    stats.add_stats()
+                    st = src.stat()
+                if _same_file(st, dst_st):
+                    outcome = "skip_identical"
+        if outcome == "copied":
+            if st is None:
+                stats.add_stats()
+                st = src.stat()
+            size = st.st_size
+            if opts.delta is not None and not opts.delta.wants(src, dst, st):
+                outcome = "unchanged"
+            elif opts.dry_run:
+                outcome = "would_copy"
+            else:
+                t0 = time.monotonic()
+                if opts.archive is not None:
+                    opts.archive.put(src, dst, st.st_size)
+                else:
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    copier.copy(src, dst)
+                seconds = _copy_seconds(t0, opts.archive)
+                stats.add_file(src, st.st_size, seconds)
     except Exception as e:
-        log.info(f"ERROR copying: {src}  -->  {dst}")
-        log.info(f"  Reason: {e}")
-
-def _copy_matches_in_folder(src_folder: Path, dst_folder: Path, exts: List[str], opts: BackupOptions, log: logging.Logger):
-    if not src_folder.is_dir():
+        outcome, error = "failed", str(e)
+        stats.add_error()
+        if opts.delta is not None:
+            opts.delta.discard(dst)
+    if outcome != "unchanged":  # unchanged files are the bulk of a delta run; the tally counts them
+        file_event(log, outcome, src, dst, size, seconds, error)
+    tally.add(str(src.parent), outcome, size if outcome == "copied" else 0)
+    return outcome
+
+def _copy_matches_in_folder(src_folder: Path, dst_folder: Path, match: discovery.Matcher, opts: BackupOptions,
+                            log: logging.Logger, tally: DirTally | None = None):
+    if opts.archive is None and opts.delta is None:
+        # plain staging: mirror the folder's own files (a persistent staging folder keeps
+        # unchanged ones and loses those deleted at the source)
+        if opts.tree.is_dir(src_folder):
+            sync_tree(src_folder, dst_folder, lambda src, dst, st: _copy_file(src, dst, opts, log, st, tally),
+                      match, delete=opts.overwrite and not opts.dry_run, stats=opts.stats, tally=tally,
+                      tree=opts.tree, recursive=False)
+        return
+    try:
+        entries = opts.tree.list_files(src_folder, match)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        if opts.stats is not None:
+            opts.stats.add_stats()
+        _copy_file(Path(entry.path), dst_folder / entry.name, opts, log, entry.stat(), tally)
+
+def _copy_matches_recursive(src_folder: Path, dst_folder: Path, match: discovery.Matcher, opts: BackupOptions,
+                            log: logging.Logger, tally: DirTally | None = None):
+    if not opts.tree.is_dir(src_folder):
         return
-    for p in src_folder.iterdir():
-        if p.is_file() and p.suffix.lower() in exts:
-            _copy_file(p, dst_folder / p.name, opts, log)
-    for p in src_folder.iterdir():  # safety, case-insensitive
-        if p.is_file() and any(p.name.lower().endswith(e) for e in exts):
-            _copy_file(p, dst_folder / p.name, opts, log)
-
-def _copy_matches_recursive(src_folder: Path, dst_folder: Path, exts: List[str], opts: BackupOptions, log: logging.Logger):
-    if not src_folder.is_dir():
+    if opts.archive is None and opts.delta is None:
+        # plain staging: mirror the folder, so an unchanged one is left untouched
+        sync_tree(src_folder, dst_folder, lambda src, dst, st: _copy_file(src, dst, opts, log, st, tally),
+                  match, delete=opts.overwrite and not opts.dry_run, stats=opts.stats, tally=tally, tree=opts.tree)
         return
-    for root, _, files in os.walk(src_folder):
-        rp = Path(root)
-        for fname in files:
-            if fname.lower().endswith(tuple(exts)):
-                src = rp / fname
-                rel = src.relative_to(src_folder)
-                dst = dst_folder / rel
-                _copy_file(src, dst, opts, log)
+    for entry in opts.tree.walk_files(src_folder, match):
+        src = Path(entry.path)
+        dst = dst_folder / src.relative_to(src_folder)
+        if opts.stats is not None:
+            opts.stats.add_stats()
+        _copy_file(src, dst, opts, log, entry.stat(), tally)
 
 # --------------------------
 # Part 1: backup_multiwork_files (uses provided backup_base_dir)
@@ -99,187 +421,426 @@ def backup_multiwork_files(source_root: Path | str, dest_root: Path | str, opts:
     source_root = Path(source_root)
     dest_root = Path(dest_root)
 
-    if not source_root.is_dir():
+    if not opts.tree.is_dir(source_root):
         raise FileNotFoundError(f"Source folder does not exist: {source_root}")
-    if not opts.dry_run:
+    staging = not opts.dry_run and opts.archive is None
+    if staging:
         dest_root.mkdir(parents=True, exist_ok=True)
 
-    # log file lives inside the SAME dest_root
-    tstamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    log_path = None if opts.dry_run else dest_root / f"backup_log_{tstamp}.txt"
-    log = setup_logger(log_path, opts.verbose)
+    # per-file lines go to the run's JSONL (and the text log when verbose); INFO gets one line per folder
+    log = get_logger(opts.verbose)
+    tally = DirTally()
 
-    exts = _norm_exts(opts.extensions)
-    exp_pat = re.compile(r"^experiment_\d{2,3}$", re.IGNORECASE)
+    match = discovery.Matcher(opts.extensions, opts.exclude)
+    stats = opts.stats or PhaseStats("unused")
+    stats.start()
 
     log.info(f"=== BACKUP START {datetime.now():%Y-%m-%d %H:%M:%S} ===")
     log.info(f"Source: {source_root}")
     log.info(f"Destination: {dest_root}")
-    log.info(f"Extensions: {', '.join(exts)}")
+    log.info(f"Files: {match.describe()}")
     log.info(f"Overwrite: {int(opts.overwrite)}  DryRun: {int(opts.dry_run)}  Verbose: {int(opts.verbose)}")
     log.info("---")
 
     # 1) Top-level files
     log.info("Step 1: Top-level files in source_root")
-    _copy_matches_in_folder(source_root, dest_root, exts, opts, log)
+    _copy_matches_in_folder(source_root, dest_root, match, opts, log, tally)
+    tally.emit(log)
 
     # 2) Experiment folders
     log.info("Step 2: Experiment folders")
-    for child in source_root.iterdir():
-        if child.is_dir() and exp_pat.match(child.name):
-            exp_src = child
-            exp_dst = dest_root / child.name
-            log.info(f"> Found experiment: {child.name}")
-            if not opts.dry_run:
-                exp_dst.mkdir(parents=True, exist_ok=True)
-
-            # 2a) Files in experiment root
-            _copy_matches_in_folder(exp_src, exp_dst, exts, opts, log)
-
-            # 2b) Selected subfolders (recursive)
-            for sub_name in opts.target_subfolders:
-                sub_src = exp_src / sub_name
-                if sub_src.is_dir():
-                    log.info(f"  - Including subfolder (recursive): {child.name}/{sub_name}")
-                    sub_dst = exp_dst / sub_name
-                    if not opts.dry_run:
-                        sub_dst.mkdir(parents=True, exist_ok=True)
-                    _copy_matches_recursive(sub_src, sub_dst, exts, opts, log)
-                else:
-                    log.info(f"  - Missing subfolder (skipped): {child.name}/{sub_name}")
-
+    for child in discovery.discover_experiments(source_root, tree=opts.tree):
+        exp_src = child
+        exp_dst = dest_root / child.name
+        log.info(f"> Found experiment: {child.name}")
+        if staging:
+            exp_dst.mkdir(parents=True, exist_ok=True)
+
+        # 2a) Files in experiment root
+        _copy_matches_in_folder(exp_src, exp_dst, match, opts, log, tally)
+
+        # 2b) Selected subfolders (recursive)
+        for sub_name in opts.target_subfolders:
+            sub_src = exp_src / sub_name
+            if opts.tree.is_dir(sub_src):
+                log.info(f"  - Including subfolder (recursive): {child.name}/{sub_name}")
+                sub_dst = exp_dst / sub_name
+                if staging:
+                    sub_dst.mkdir(parents=True, exist_ok=True)
+                _copy_matches_recursive(sub_src, sub_dst, match, opts, log, tally)
+            else:
+                log.info(f"  - Missing subfolder (skipped): {child.name}/{sub_name}")
+                if staging and opts.overwrite:
+                    _drop_stale(exp_dst / sub_name, tally)
+        tally.emit(log)
+
+    stats.stop()
+    log.info(f"Step stats: {stats.files} files, {stats.bytes / 1e6:.1f} MB in {stats.seconds:.1f}s, "
+             f"{stats.stat_calls} stat calls, {stats.errors} errors")
     log.info(f"=== BACKUP COMPLETE {datetime.now():%Y-%m-%d %H:%M:%S} ===")
 
 # --------------------------
 # Part 2: Subject-wise backup (uses SAME backup_base_dir)
 # --------------------------
 
+def _stage_file(src: Path, dst: Path, delta: DeltaSelector | None, archive: ArchiveWriter | None = None,
+                stats: PhaseStats | None = None, tally: DirTally | None = None,
+                st: os.stat_result | None = None, skip_same: bool = False):
+    """Stage one file. skip_same leaves an already staged copy with the same size and
+       mtime alone (sync_tree callers have checked that already)."""
+    stats = stats or PhaseStats("unused")
+    tally = tally or DirTally()
+    if st is None:
+        stats.add_stats()
+        st = src.stat()
+    if delta is not None and not delta.wants(src, dst, st):
+        tally.add(str(src.parent), "unchanged")
+        return
+    if skip_same and archive is None:
+        stats.add_stats()
+        try:
+            if _same_file(st, dst.stat()):
+                tally.add(str(src.parent), "unchanged")
+                return
+        except FileNotFoundError:
+            pass
+    t0 = time.monotonic()
+    try:
+        if archive is not None:
+            archive.put(src, dst, st.st_size)
+        else:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            copier.copy(src, dst)
+    except Exception:
+        if delta is not None:
+            delta.discard(dst)   # never record a file that is not in the archive
+        raise
+    seconds = _copy_seconds(t0, archive)
+    stats.add_file(src, st.st_size, seconds)
+    file_event(logger, "copied", src, dst, st.st_size, seconds)
+    tally.add(str(src.parent), "copied", st.st_size)
+
+def _stage_tree(src_folder: Path, dst_folder: Path, delta: DeltaSelector | None, archive: ArchiveWriter | None = None,
+                stats: PhaseStats | None = None, tally: DirTally | None = None,
+                tree: discovery.LiveTree = discovery.LIVE):
+    stats = stats or PhaseStats("unused")
+    tally = tally or DirTally()
+    if archive is not None:
+        for entry in tree.walk_files(src_folder):
+            src = Path(entry.path)
+            _stage_file(src, dst_folder / src.relative_to(src_folder), delta, archive, stats, tally, entry.stat())
+        return
+
+    # staging folder: sync in place instead of rmtree + copytree, so unchanged files are not rewritten
+    sync_tree(src_folder, dst_folder, lambda src, dst, st: _stage_file(src, dst, delta, None, stats, tally, st),
+              stats=stats, tally=tally, tree=tree)
+
+def _drop_stale(dst: Path, tally: DirTally | None = None):
+    """Remove a staged file or folder whose source is gone (only a persistent staging
+       folder has any); a fresh staging folder costs one failed stat."""
+    try:
+        if dst.is_dir():
+            shutil.rmtree(dst)
+        else:
+            dst.unlink()
+    except FileNotFoundError:
+        return
+    file_event(logger, "deleted", dst)
+    if tally is not None:
+        tally.add(str(dst.parent), "deleted")
+
+EXTRA_P_MATCH = discovery.Matcher(["*boxes.mat", "*boxes_face.mat"])
+SUBJECT_WORKERS = 4   # subjects staged concurrently; each is an independent unit of work
+
+def _subject_bytes(exp_dir: Path, subj_dir: Path, folder_names: List[str], manifest: Manifest | None = None,
+                   tree: discovery.LiveTree = discovery.LIVE) -> int:
+    """Size of a subject, used to start the largest first, without walking the share
+       twice: the shared inventory's listings, else what the manifest recorded for the
+       subject last time. A subject the manifest has never seen is all new work, so it
+       ranks first. Without either (no incremental mode, no inventory) this is only a
+       rough guess: the number of entries in the subject folder, one scandir, which
+       says little about bytes but keeps the ordering from costing a second walk."""
+    if isinstance(tree, Inventory):
+        total = 0
+        for name in folder_names:
+            try:
+                total += sum(e.stat().st_size for e in tree.walk_files(subj_dir / name))
+            except OSError:
+                pass   # missing folders are reported when the subject is staged
+        return total
+    if manifest is not None:
+        return manifest.size_under(f"{exp_dir.name}/{subj_dir.name}/") or sys.maxsize
+    try:
+        with os.scandir(subj_dir) as it:
+            return sum(1 for _ in it)
+    except OSError:
+        return 0
+
+def _backup_subject(subj_dir: Path, out_subj_dir: Path, folder_names: List[str], include_extra_p_rules: bool,
+                    delta: DeltaSelector | None, archive: ArchiveWriter | None, stats: PhaseStats,
+                    tree: discovery.LiveTree = discovery.LIVE):
+    """Stage one subject: its trial info files plus the configured subfolders."""
+    subj_name = subj_dir.name  # e.g., __20160225_17406
+    tally = DirTally()
+    if archive is None:
+        out_subj_dir.mkdir(parents=True, exist_ok=True)
+
+    # Trial info files
+    trial_info_mat = subj_dir / f"{subj_name}_info.mat"
+    trial_info_txt = subj_dir / f"{subj_name}_info.txt"
+
+    stats.add_stats(2)
+    if tree.is_file(trial_info_mat):
+        _stage_file(trial_info_mat, out_subj_dir / trial_info_mat.name, delta, archive, stats, tally, skip_same=True)
+    else:
+        logger.warning(f"MAT file not found: {trial_info_mat}")
+        if archive is None:
+            _drop_stale(out_subj_dir / trial_info_mat.name, tally)
+
+    if tree.is_file(trial_info_txt):
+        _stage_file(trial_info_txt, out_subj_dir / trial_info_txt.name, delta, archive, stats, tally, skip_same=True)
+    else:
+        logger.warning(f"TXT file not found: {trial_info_txt}")
+        if archive is None:
+            _drop_stale(out_subj_dir / trial_info_txt.name, tally)
+
+    # Copy configured subfolders; flat ones (direct files only) are synced like _stage_tree when staging
+    flat = {"extra_p": EXTRA_P_MATCH} if include_extra_p_rules else {}
+    flat["supporting_files"] = None
+    for folder_name in folder_names:
+        src_folder = subj_dir / folder_name
+        dst_folder = out_subj_dir / folder_name
+
+        if folder_name in flat and tree.is_dir(src_folder):
+            match = flat[folder_name]
+            if archive is None:
+                sync_tree(src_folder, dst_folder,
+                          lambda src, dst, st: _stage_file(src, dst, delta, None, stats, tally, st),
+                          match, stats=stats, tally=tally, tree=tree, recursive=False)
+                continue
+            for entry in tree.list_files(src_folder, match):
+                _stage_file(Path(entry.path), dst_folder / entry.name, delta, archive, stats, tally, entry.stat())
+
+        elif tree.is_dir(src_folder):
+            _stage_tree(src_folder, dst_folder, delta, archive, stats, tally, tree)
+        else:
+            logger.warning(f"Missing folder for subject {subj_name}: {src_folder}")
+            if archive is None:
+                _drop_stale(dst_folder, tally)
+    tally.emit(logger)
+
 def backup_subjects_autodiscover(
     multiwork_root: Path,
     backup_base_dir: Path,                  # <-- now we accept the SAME folder
     subject_folders_to_copy: Iterable[str],
     include_extra_p_rules: bool = True,
-):
+    delta: DeltaSelector | None = None,
+    archive: ArchiveWriter | None = None,
+    stats: PhaseStats | None = None,
+    workers: int = SUBJECT_WORKERS,
+    tree: discovery.LiveTree = discovery.LIVE,
+) -> List[str]:
     """
     Discover experiments/subjects and copy into the provided backup_base_dir (no new timestamp).
+    Subjects are staged on a pool of `workers` threads, largest first so a big subject
+    does not start last and hold up the phase. A failing subject is logged and skipped;
+    the others carry on. Returns the failed subjects as 'experiment/subject'.
+    With a DeltaSelector only files new/changed since the last archive are copied.
+    With an ArchiveWriter files go straight into the zip and backup_base_dir is never created.
+    Files, bytes and stat calls are counted into `stats` if given.
+    Source folders are listed through `tree` (live, or a shared Inventory).
     """
-    backup_base_dir.mkdir(parents=True, exist_ok=True)
-    print(f"[INFO] Backup staging: {backup_base_dir}")
-
-    exp_pat = re.compile(r"^experiment_\d{2,3}$", re.IGNORECASE)
-    subj_pat = re.compile(r"^__\d{8}_\d+$")  # e.g., __20160225_17406
-
-    experiments = [p for p in multiwork_root.iterdir() if p.is_dir() and exp_pat.match(p.name)]
+    stats = stats or PhaseStats("unused")
+    stats.start()
+    folder_names = list(subject_folders_to_copy)
+    if archive is None:
+        backup_base_dir.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Backup staging: {backup_base_dir}")
+    else:
+        logger.info(f"Writing directly to: {archive.final_path}")
 
-    for exp_dir in experiments:
-        included = exp_dir / "included"
-        if not included.is_dir():
-            print(f"[WARN] No 'included' folder in {exp_dir}")
+    # experiments are listed concurrently; every subject becomes one job
+    jobs: List[Tuple[Path, Path]] = []
+    for exp_dir, subjects, err in discovery.iter_subjects(multiwork_root, fallback=False, tree=tree):
+        if isinstance(err, (FileNotFoundError, NotADirectoryError)):
+            logger.warning(f"No 'included' folder in {exp_dir}")
+            continue
+        if err is not None:
+            logger.warning(f"Could not list subjects in {exp_dir}: {err}")
+            stats.add_error()
             continue
-
-        subjects = [p for p in included.iterdir() if p.is_dir() and subj_pat.match(p.name)]
         if not subjects:
-            print(f"[WARN] No subject folders found in: {included}")
+            logger.warning(f"No subject folders found in: {exp_dir / 'included'}")
             continue
-
-        out_exp_dir = backup_base_dir / exp_dir.name
-        out_exp_dir.mkdir(parents=True, exist_ok=True)
-
-        for subj_dir in subjects:
-            subj_name = subj_dir.name  # e.g., __20160225_17406
-            out_subj_dir = out_exp_dir / subj_name
-            out_subj_dir.mkdir(parents=True, exist_ok=True)
-
-            # Trial info files
-            trial_info_mat = subj_dir / f"{subj_name}_info.mat"
-            trial_info_txt = subj_dir / f"{subj_name}_info.txt"
-
-            if trial_info_mat.exists():
-                shutil.copy2(trial_info_mat, out_subj_dir)
-            else:
-                print(f"[WARN] MAT file not found: {trial_info_mat}")
-
-            if trial_info_txt.exists():
-                shutil.copy2(trial_info_txt, out_subj_dir)
-            else:
-                print(f"[WARN] TXT file not found: {trial_info_txt}")
-
-            # Copy configured subfolders
-            for folder_name in subject_folders_to_copy:
-                src_folder = subj_dir / folder_name
-                dst_folder = out_subj_dir / folder_name
-
-                if folder_name == "extra_p" and include_extra_p_rules and src_folder.is_dir():
-                    dst_folder.mkdir(parents=True, exist_ok=True)
-                    for p in src_folder.glob("*boxes.mat"):
-                        shutil.copy2(p, dst_folder / p.name)
-                    for p in src_folder.glob("*boxes_face.mat"):
-                        shutil.copy2(p, dst_folder / p.name)
-
-                elif folder_name == "supporting_files" and src_folder.is_dir():
-                    dst_folder.mkdir(parents=True, exist_ok=True)
-                    for p in src_folder.iterdir():
-                        if p.is_file():
-                            shutil.copy2(p, dst_folder / p.name)
-
-                elif src_folder.is_dir():
-                    if dst_folder.exists():
-                        shutil.rmtree(dst_folder)
-                    shutil.copytree(src_folder, dst_folder)
-                else:
-                    print(f"[WARN] Missing folder for subject {subj_name}: {src_folder}")
+        jobs.extend((exp_dir, subj_dir) for subj_dir in subjects)
+
+    manifest = delta.manifest if delta is not None else None
+    sizes = {job: n for job, n, _ in
+             discovery.stream_map(lambda job: _subject_bytes(*job, folder_names, manifest, tree), jobs, workers)}
+    jobs.sort(key=lambda job: -(sizes.get(job) or 0))
+    logger.info(f"{len(jobs)} subjects, {workers} workers")
+
+    def _run(job: Tuple[Path, Path]):
+        exp_dir, subj_dir = job
+        _backup_subject(subj_dir, backup_base_dir / exp_dir.name / subj_dir.name, folder_names,
+                        include_extra_p_rules, delta, archive, stats, tree)
+
+    failed: List[str] = []
+    for (exp_dir, subj_dir), _, err in discovery.stream_map(_run, jobs, workers):
+        if err is not None:
+            failed.append(f"{exp_dir.name}/{subj_dir.name}")
+            stats.add_error()
+            logger.error(f"Subject {exp_dir.name}/{subj_dir.name} failed: {err}")
+    if failed:
+        logger.warning(f"{len(failed)} of {len(jobs)} subjects failed: {', '.join(sorted(failed))}")
+    stats.stop()
+    return failed
 
 # --------------------------
 # Zipping + cleanup (uses SAME backup_base_dir)
 # --------------------------
 
-def zip_move_cleanup(backup_base_dir: Path, zip_destination_dir: Path):
+def zip_move_cleanup(backup_base_dir: Path, zip_destination_dir: Path,
+                     shards: int = 1, level: int = ZIP_LEVEL, stats: PhaseStats | None = None,
+                     zip_name: str | None = None, keep_staging: bool = False) -> bool:
+    """Zip the staging folder, move the zip(s) into place and delete staging. Returns success.
+       zip_name defaults to the staging folder's name; keep_staging leaves a persistent
+       staging folder in place for the next run to sync."""
+    stats = stats or PhaseStats("unused")
+    stats.start()
     zip_destination_dir.mkdir(parents=True, exist_ok=True)
-    zip_file_path = backup_base_dir.with_suffix(".zip")
-    print(f"[INFO] Creating zip: {zip_file_path.name}")
+    zip_file_path = backup_base_dir.with_name(f"{zip_name or backup_base_dir.name}.zip")
+    logger.info(f"Creating zip: {zip_file_path.name}")
     try:
-        with zipfile.ZipFile(zip_file_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-            parent = backup_base_dir.parent
-            for root, _, files in os.walk(backup_base_dir):
-                for fname in files:
-                    fpath = Path(root) / fname
-                    arcname = fpath.relative_to(parent)  # relative to parent dir
-                    zf.write(fpath, arcname)
-
-        final_zip = zip_destination_dir / zip_file_path.name
-        shutil.move(str(zip_file_path), final_zip)
-        print(f"[INFO] Zip moved to: {final_zip}")
-
-        shutil.rmtree(backup_base_dir)
-        print(f"[INFO] Deleted staging folder: {backup_base_dir}")
+        writer = ArchiveWriter(zip_file_path, root=backup_base_dir, shards=shards, level=level)
+        for entry in discovery.walk_files(backup_base_dir):
+            fpath = Path(entry.path)
+            stats.add_stats()
+            writer.put(fpath, fpath, entry.stat().st_size)  # arcname relative to parent dir
+
+        parts = writer.close(stats)
+        stats.files += writer.count
+        stats.bytes += writer.total_bytes
+        stats.errors += len(writer.failed)
+        for part in parts:
+            final_zip = zip_destination_dir / part.name
+            shutil.move(str(part), final_zip)
+            logger.info(f"Zip moved to: {final_zip}")
+
+        if not keep_staging:
+            shutil.rmtree(backup_base_dir)
+            logger.info(f"Deleted staging folder: {backup_base_dir}")
+        return True
     except Exception as e:
-        print(f"[ERROR] During ZIP or cleanup: {e}")
+        stats.add_error()
+        logger.error(f"During ZIP or cleanup: {e}")
+        return False
+    finally:
+        stats.stop()
 
 # --------------------------
 # CONFIG + MAIN
 # --------------------------
 
-def main():
+# Folders read below each experiment (recursive) and each subject. Module-level so
+# backup_runner.py can scan exactly these once for both jobs.
+EXPERIMENT_SUBFOLDERS = ['stimuli_images', 'survey_data', 'MCDI']
+SUBJECT_FOLDERS = ['derived', 'reliability', 'speech_transcription_p', 'supporting_files']
+# If you also need 'extra_p':
+# SUBJECT_FOLDERS = ['derived', 'reliability', 'speech_transcription_p', 'supporting_files', 'extra_p']
+
+def main(tree: discovery.LiveTree = discovery.LIVE):
+    """Run the data backup; `tree` may be a shared Inventory (see backup_runner.py)."""
     # Paths
     multiwork_path = Path(r"M:\ ").resolve()
     multiwork_path = Path(str(multiwork_path).strip())
     y_drive = Path(r"Y:\ ").resolve()
     y_drive = Path(str(y_drive).strip())
 
-    # Single timestamp + SINGLE backup_base_dir
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_base_dir = y_drive / f"backup_{timestamp}"
-
     # Where the final zip should go
     zip_destination_dir = y_drive / r"multiwork_active_exp_backup\data_backup"
 
+    # Incremental mode: only files new/changed since the last archive go into
+    # backup_{timestamp}_delta.zip; a full backup_{timestamp}.zip baseline is
+    # made every full_baseline_days. Restore = latest baseline + later deltas, minus the
+    # files each delta's DELETED_LIST names (backup_catalog.py restore does this).
+    incremental = True
+    full_baseline_days = 30
+
+    # Direct-to-archive: stream files straight into the zip (written as .zip.tmp and
+    # renamed), instead of copying into backup_base_dir, zipping it and deleting it.
+    # Zip members pass through deflate / the zip writer in user space either way; the
+    # in-kernel copy backend (backup_copy) is only used for staged copies, i.e. with
+    # direct_to_archive = False, and by backup_exp_video.py.
+    direct_to_archive = True
+
+    # Compression: files are spread over zip_shards archive parts written by parallel
+    # processes (1 = single .zip); STORED_EXTS are stored, the rest deflated at zip_level.
+    zip_shards = min(4, os.cpu_count() or 1)
+    zip_level = ZIP_LEVEL
+
+    # Target: "zip" archives as above, or "store" = content-addressed dedup store shared
+    # with the video job. Each run then writes only unseen content plus a snapshot
+    # listing every file; restore any snapshot with backup_store.py.
+    backup_target = "zip"
+    store_root = y_drive / r"multiwork_active_exp_backup\dedup_store"
+
+    # Catalog of every backed-up file (shared with the video job), so restores read only
+    # the zip members they need: python backup_catalog.py restore <catalog> <target> --subject ...
+    catalog_path = y_drive / r"multiwork_active_exp_backup\catalog.sqlite"
+    if backup_target == "store":
+        incremental = False   # snapshots are complete; unchanged files cost a stat, not a copy
+
+    # Persistent staging (zip target): keep one staging folder between runs and sync it in
+    # place (sync_tree), so only new/changed files are copied off the share and files deleted
+    # there are removed; each zip is then a full baseline made from that mirror. Whole subject
+    # or experiment folders removed from the share stay in the mirror until it is cleared.
+    persistent_staging = False
+    staging_dir = y_drive / "backup_staging"
+    if persistent_staging and backup_target == "zip":
+        direct_to_archive = False
+        incremental = False
+
+    # log to a local file from a background thread; the log and the per-file JSONL
+    # are copied next to the run reports at the end. verbose also writes every per-file
+    # line to the text log and console (DEBUG); otherwise they are only in the JSONL
+    verbose = False
+    run_log = RunLog("data", verbose=verbose)
+    metrics = RunMetrics("data")
+    manifest = None
+    full = True
+    if incremental:
+        manifest = Manifest.open(zip_destination_dir / "data_manifest.sqlite")
+        last_full = manifest.get_meta('last_full_backup')
+        full = last_full is None or time.time() - float(last_full) > full_baseline_days * 86400
+
+    # Single timestamp + SINGLE backup_base_dir
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    archive_name = f"backup_{timestamp}{'' if full else '_delta'}"
+    backup_base_dir = staging_dir if persistent_staging else y_drive / archive_name
+    delta = DeltaSelector(manifest, backup_base_dir, full) if manifest is not None else None
+    logger.info(f"Mode: {'full baseline' if full else 'incremental delta'}")
+    archive = None
+    store = None
+    if backup_target == "store":
+        store = BlobStore(store_root)
+        archive = SnapshotWriter(store, f"data_{timestamp}", root=backup_base_dir)
+    elif direct_to_archive:
+        archive = ArchiveWriter(zip_destination_dir / f"{archive_name}.zip", root=backup_base_dir,
+                                shards=zip_shards, level=zip_level)
+
+    # Subjects are staged concurrently, largest first
+    subject_workers = SUBJECT_WORKERS
+
     # Subject subfolders to copy
-    subject_folders = ['derived', 'reliability', 'speech_transcription_p', 'supporting_files']
-    # If you also need 'extra_p', uncomment:
-    # subject_folders = ['derived', 'reliability', 'speech_transcription_p', 'supporting_files', 'extra_p']
+    subject_folders = SUBJECT_FOLDERS
+
+    # with a zip ArchiveWriter these steps only list and queue files, so their phases say so
+    # (the zip phase has the real I/O); staged and store copies move the bytes right away
+    phase_suffix = "_queued" if isinstance(archive, ArchiveWriter) else ""
 
     # STEP 1: sweep multiwork files into SAME backup_base_dir
-    print("[INFO] Running backup_multiwork_files(...)")
+    logger.info("Running backup_multiwork_files(...)")
     backup_multiwork_files(
         source_root=multiwork_path,
         dest_root=backup_base_dir,
@@ -287,22 +848,109 @@ def main():
             extensions=['.txt', '.png', '.jpg', '.csv', '.xlsx'],
             overwrite=True,
             dry_run=False,
-            verbose=True,
-            target_subfolders=['stimuli_images', 'survey_data', 'MCDI']
+            verbose=verbose,
+            target_subfolders=EXPERIMENT_SUBFOLDERS,
+            delta=delta,
+            archive=archive,
+            stats=metrics.phase(f"multiwork{phase_suffix}"),
+            tree=tree,
         )
     )
 
     # STEP 2: subjects into SAME backup_base_dir
-    print("[INFO] Running backup_subjects_autodiscover(...)")
-    backup_subjects_autodiscover(
+    logger.info("Running backup_subjects_autodiscover(...)")
+    failed_subjects = backup_subjects_autodiscover(
         multiwork_root=multiwork_path,
         backup_base_dir=backup_base_dir,             # <-- SAME FOLDER
         subject_folders_to_copy=subject_folders,
         include_extra_p_rules=True,
+        delta=delta,
+        archive=archive,
+        stats=metrics.phase(f"subjects{phase_suffix}"),
+        workers=subject_workers,
+        tree=tree,
     )
 
-    # STEP 3: zip/move/cleanup using SAME backup_base_dir
-    zip_move_cleanup(backup_base_dir=backup_base_dir, zip_destination_dir=zip_destination_dir)
+    # Deltas also list what was deleted since the previous archive (backup_catalog drops those
+    # files from baseline + delta restores); subjects that failed are left out of the check
+    if delta is not None and not full:
+        deleted = delta.deleted(failed_subjects)
+        if deleted:
+            listing = backup_base_dir / DELETED_LIST
+            text = "\n".join(deleted) + "\n"
+            if archive is not None:
+                archive.put_text(listing, text)
+            else:
+                listing.write_text(text, encoding="utf-8")
+            logger.info(f"{len(deleted)} files deleted since the last archive")
+
+    # STEP 3: zip/move/cleanup using SAME backup_base_dir (or finalise the direct archive)
+    if archive is not None:
+        zip_stats = metrics.phase("zip")
+        zip_stats.start()
+        try:
+            parts = archive.close(zip_stats) if isinstance(archive, ArchiveWriter) else archive.close()
+            for part in parts:
+                logger.info(f"Written: {part}")
+            logger.info(f"{archive.count} files archived, {len(archive.failed)} failed")
+            zip_stats.files += archive.count
+            zip_stats.bytes += archive.total_bytes
+            zip_stats.add_error(len(archive.failed))
+            if delta is not None:
+                for dst in archive.failed:
+                    delta.discard(dst)
+            ok = True
+        except Exception as e:
+            logger.error(f"Finalising archive: {e}")
+            zip_stats.add_error()
+            archive.abort()
+            ok = False
+        zip_stats.stop()
+        if store is not None:
+            logger.info(f"Store: {store.bytes_written / 1e6:.1f} MB new, "
+                        f"{store.bytes_deduped / 1e6:.1f} MB deduplicated")
+            metrics.info.update(store_bytes_written=store.bytes_written, store_bytes_deduped=store.bytes_deduped)
+            store.close()
+    else:
+        ok = zip_move_cleanup(backup_base_dir=backup_base_dir, zip_destination_dir=zip_destination_dir,
+                              shards=zip_shards, level=zip_level, stats=metrics.phase("zip"),
+                              zip_name=archive_name, keep_staging=persistent_staging)
+
+    # STEP 4: only record what made it into an archive
+    if delta is not None:
+        if ok:
+            delta.commit()
+            logger.info(f"Archived {len(delta.pending)} files, {delta.skipped} unchanged skipped")
+            metrics.info.update(delta_selected=len(delta.pending), delta_skipped=delta.skipped)
+        manifest.close()
+
+    # STEP 5: catalog what was archived
+    if ok:
+        try:
+            with Catalog.open(catalog_path) as catalog:
+                if store is not None:
+                    run, n = archive.name, catalog.add_snapshot(store, archive.name, "data", full=True)
+                else:
+                    run = archive_name
+                    n = catalog.add_zip(run, "data", parts if archive is not None
+                                        else zip_parts(zip_destination_dir, run), full=full)
+            logger.info(f"Catalog: {n} files recorded for {run}")
+        except Exception as e:
+            logger.warning(f"Could not update catalog {catalog_path}: {e}")
+
+    # STEP 6: run report (+ one line in history.jsonl) next to the archives
+    metrics.info.update(mode='full' if full else 'delta', target=backup_target,
+                        direct_to_archive=direct_to_archive, persistent_staging=persistent_staging,
+                        zip_shards=zip_shards, ok=ok,
+                        subject_workers=subject_workers, failed_subjects=failed_subjects,
+                        copy_strategies=copier.report())
+    logger.info(f"Copy: {copier.summary()}")
+    logger.info(f"Timing: {metrics.summary()}")
+    try:
+        logger.info(f"Run report: {metrics.write(zip_destination_dir / 'reports')}")
+    except OSError as e:
+        logger.warning(f"Could not write run report: {e}")
+    run_log.close(publish_to=zip_destination_dir / 'reports')
 
 if __name__ == "__main__":
     main()
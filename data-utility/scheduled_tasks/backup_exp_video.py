@@ -3,43 +3,121 @@
 
 """
 INCREMENTAL VIDEO BACKUP
-- Scans all experiment_* folders in MULTIWORK_ROOT.
+- Scans all experiment_* folders in MULTIWORK_ROOT (concurrently, via backup_discovery).
 - For each experiment, finds subjects inside 'included' matching '__YYYYMMDD_XXXXX'.
 - Under each subject, finds camera folders matching 'camNN_video_r'.
-- Recursively copies only NEW or CHANGED video files (by size/mtime) to a time-stamped batch.
-- Updates persistent CSV manifest so future runs are incremental.
+- Recursively copies only NEW or CHANGED video files to a time-stamped batch: size/mtime
+  first, then a head/middle/tail sample hash when only the mtime moved (backup_integrity).
+  Scanning, manifest comparison and copying overlap: rows stream to the copy pool as soon
+  as each subject has been scanned, with bounded queues in between.
+- Copies run on a bounded thread pool, capped per destination volume and optionally bandwidth-limited.
+- Files are copied in large chunks to a '.part' temp file and renamed into place; a journal of
+  completed rows and partial byte offsets lets an interrupted run resume where it stopped.
+  The full SHA-256 is computed from the copy buffers and stored in the manifest, so
+  `python backup_integrity.py verify <DEST_ROOT>` can re-check the backup later. With
+  FULL_HASH_ON_COPY off (an explicit opt-in), bytes move in-kernel (backup_copy) and
+  only the sample is stored.
+- Cut off at COPY_DEADLINE or COPY_BYTE_BUDGET: the scan stops there too, rows pulled but
+  not started are saved to DEST_ROOT/copy_queue.json and go first next run (ahead of the
+  streamed scan), and the folders not reached are listed again. Optionally the whole plan
+  is ordered by priority (queued files, never-backed-up files, newest subjects, smallest first).
+- Subject and camera folders whose directory fingerprint is unchanged since the last
+  successful run are skipped without listing them; a full rescan is forced periodically.
+- Updates a persistent SQLite manifest (migrated once from the old manifest.csv)
+  so future runs are incremental.
+- Optionally (STORE_MODE) writes into the content-addressed store shared with the data
+  backup instead of batch folders: identical videos are kept once, and each run records a
+  snapshot chained to the previous one (restore with backup_store.py).
+- Logs through backup_logging: a background writer to a local log file, one summary
+  line per camera folder instead of per file, and a per-file JSONL; both are copied
+  to DEST_ROOT/reports at the end.
+- Records every copied file in the backup catalog (backup_catalog.py) in batches as copies
+  complete, which finds and restores a subject's newest copies without searching the
+  batch folders.
+- Writes a JSON run report (per-phase time, files, bytes, MB/s, stat calls, errors,
+  slowest files) to DEST_ROOT/reports and appends it to reports/history.jsonl.
 
 Tested on Windows-style paths. Requires Python 3.9+.
 """
 
 import os
-import re
-import csv
+import errno
 import sys
+import json
+import time
 import shutil
+import threading
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Iterable, Dict, Tuple, List
+from typing import Iterable, Iterator, Dict, Tuple, List
+
+import backup_discovery as discovery
+import backup_integrity as integrity
+from backup_manifest import Manifest
+from backup_logging import DirTally, RunLog, file_event, get_logger
+from backup_copy import CopyBackend
+from backup_catalog import CATALOG_BATCH, CATALOG_NAME, Catalog
+from backup_metrics import PhaseStats, RunMetrics
+from backup_store import BlobStore, SnapshotWriter
 
 # =============== CONFIG ===============
 MULTIWORK_ROOT = Path(r"M:\ ").resolve()     # root containing experiment_* folders
 MULTIWORK_ROOT = Path(str(MULTIWORK_ROOT).strip())
 
 DEST_ROOT      = Path(r"Y:\multiwork_active_exp_backup\video_backup_incremental").resolve()
-VIDEO_EXTS     = ['.mp4', '.avi', '.mov', '.mkv', '.m4v']  # case-insensitive
-CAM_DIR_REGEX  = re.compile(r"^cam\d{2}_video_r$", re.IGNORECASE)
-EXP_REGEX      = re.compile(r"^experiment_\d{2,3}$", re.IGNORECASE)
-SUBJ_REGEX     = re.compile(r"^__\d{8}_\d+$")              # e.g., __20160225_17406
+VIDEO_EXTS     = ['.mp4', '.avi', '.mov', '.mkv', '.m4v']  # case-insensitive; globs allowed
+VIDEO_EXCLUDE  = []                                       # e.g. ['*_preview.mp4']
+CAM_DIR_REGEX  = discovery.CAM_DIR_REGEX                  # camNN_video_r
+EXP_REGEX      = discovery.EXP_REGEX                      # experiment_NN
+SUBJ_REGEX     = discovery.SUBJ_REGEX                     # e.g., __20160225_17406
+SCAN_WORKERS   = discovery.SCAN_WORKERS                   # concurrent subject scans
 
 DRY_RUN        = False  # True = simulate, print actions, no copying
+
+COPY_WORKERS       = 8     # concurrent copy streams
+MAX_PER_VOLUME     = 4     # concurrent copies allowed per destination volume
+MAX_BYTES_PER_SEC  = 0     # aggregate bandwidth ceiling, 0 = unlimited
+COPY_BUFFER_SIZE   = 8 * 1024 * 1024
+FULL_HASH_ON_COPY  = True  # False = in-kernel copy (copy_file_range/sendfile) where possible; only the sample hash is
+                           # stored, so verify checks ~3 MB samples instead of whole files. Hashing is cheap next to
+                           # a network-bound copy; only turn it off for fast local destinations.
+CHECKPOINT_BYTES   = 256 * 1024 * 1024  # journal a partial-copy offset every N bytes
+PART_SUFFIX        = ".part"
+
+PRIORITY_ORDER     = False # True = carried-over, never-backed-up, newest-subject files first, then smallest; the
+                           # whole scan then completes before copying starts (no scan/copy overlap, plan held in memory)
+COPY_DEADLINE      = None  # e.g. "06:30": start no new copies after this local time; None = no limit
+COPY_BYTE_BUDGET   = 0     # start no new copies once this many bytes are under way, 0 = unlimited
+
+FULL_RESCAN_DAYS   = 7     # ignore directory fingerprints if the last full scan is older
+FORCE_FULL_RESCAN  = False # True = ignore directory fingerprints this run
+
+SAMPLE_CHECK       = True  # mtime moved but size did not: compare a sample hash before recopying
+RECHECK_UNCHANGED  = False # also sample files whose size/mtime match (catches same-mtime edits, ~3 MB read each)
+
+STORE_MODE         = False # True = dedup store below instead of timestamped batch folders
+DEDUP_STORE_ROOT   = DEST_ROOT.parent / "dedup_store"  # shared with backup_exp_data.py
+CATALOG_PATH       = DEST_ROOT.parent / CATALOG_NAME    # rel_path -> run/location index, shared with backup_exp_data.py
 # ======================================
 
+VIDEO_MATCH = discovery.Matcher(VIDEO_EXTS, VIDEO_EXCLUDE)
+logger = get_logger()
+copier = CopyBackend(buffer_size=COPY_BUFFER_SIZE)
+
 
 @dataclass
 class Counters:
     copied_ok: int = 0
     failed: int = 0
+    bytes_copied: int = 0
+    failed_paths: List[str] = field(default_factory=list)
+    deferred: List["PlanRow"] = field(default_factory=list)  # stored rows the caller must upsert
+    elapsed: float = 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return (self.bytes_copied / 1e6) / self.elapsed if self.elapsed > 0 else 0.0
 
 
 @dataclass
@@ -49,48 +127,103 @@ class PlanRow:
     mtime: float
     src: Path
     dst: Path
+    digest: str | None = None   # full SHA-256, set once copied
+    sample: str | None = None   # sample hash (backup_integrity.sample_hash)
 
 
 @dataclass
-class Manifest:
-    rows: Dict[str, Tuple[int, float]] = field(default_factory=dict)  # rel_path -> (size, mtime)
-
-    @staticmethod
-    def load(csv_path: Path) -> "Manifest":
-        m = Manifest()
-        if csv_path.exists():
-            with csv_path.open('r', newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                # expects: rel_path,size,mtime
-                for row in reader:
-                    rel = row.get('rel_path', '')
-                    if not rel:
-                        continue
-                    try:
-                        size = int(float(row.get('size', '0')))
-                        mtime = float(row.get('mtime', '0'))
-                    except Exception:
-                        continue
-                    m.rows[rel] = (size, mtime)
-        return m
-
-    def save(self, csv_path: Path):
-        csv_path.parent.mkdir(parents=True, exist_ok=True)
-        with csv_path.open('w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=['rel_path', 'size', 'mtime'])
-            writer.writeheader()
-            for rel_path, (size, mtime) in self.rows.items():
-                writer.writerow({'rel_path': rel_path, 'size': size, 'mtime': mtime})
-
-    def needs_copy(self, rel_path: str, size: int, mtime: float) -> bool:
-        """Return True if file is NEW or CHANGED vs manifest."""
-        if rel_path not in self.rows:
+class DirFingerprint:
+    parent: str
+    mtime: float | None  # None = contains subfolders, always rescan
+    entries: int
+    total_size: int
+
+
+class DirCache:
+    """Directory fingerprints stored next to the manifest, used to prune unchanged trees.
+
+    A subject or cam dir is skipped when its st_mtime equals the fingerprint
+    recorded after the last run that backed it up without failures. Fresh
+    fingerprints are only staged during planning and written by commit(),
+    once the copy outcome is known. In-place rewrites that do not touch a
+    directory's mtime are picked up by the periodic full rescan.
+
+    Fingerprints are loaded up front, so lookups are safe from the scan
+    worker threads. A subject's fingerprints are staged by iter_plan once all
+    its rows have been handed on, so a plan that is abandoned part-way (copy
+    window closed) leaves the rest to be listed again; only commit() touches
+    the database.
+    """
+
+    def __init__(self, manifest: Manifest | None, full_rescan: bool = False):
+        self.manifest = manifest
+        self.staged: Dict[str, DirFingerprint] = {}
+        self.forgotten: set[str] = set()
+        self.failed: set[str] = set()   # subjects whose scan failed this run
+        self.pruned = 0
+        self._lock = threading.Lock()
+        last = manifest.get_meta('last_full_scan') if manifest is not None else None
+        self.full_rescan = (full_rescan or last is None
+                            or time.time() - float(last) > FULL_RESCAN_DAYS * 86400)
+        self.cached: Dict[str, DirFingerprint] = {}
+        self.children: Dict[str, List[str]] = {}
+        if manifest is not None and not self.full_rescan:
+            for rel_dir, *fp in manifest.conn.execute(
+                    "SELECT rel_dir, parent, mtime, entries, total_size FROM dirs"):
+                self.cached[rel_dir] = DirFingerprint(*fp)
+                self.children.setdefault(fp[0], []).append(rel_dir.rsplit('/', 1)[-1])
+
+    def unchanged(self, rel_dir: str, mtime: float) -> bool:
+        fp = self.cached.get(rel_dir)
+        if fp is not None and fp.mtime is not None and fp.mtime == mtime:
+            with self._lock:
+                self.pruned += 1
             return True
-        old_size, old_mtime = self.rows[rel_path]
-        return (old_size != size) or (old_mtime < mtime)
-
-    def upsert(self, rel_path: str, size: int, mtime: float):
-        self.rows[rel_path] = (size, mtime)
+        return False
+
+    def cached_children(self, rel_dir: str) -> List[str]:
+        return list(self.children.get(rel_dir, []))
+
+    def stage(self, rel_dir: str, fp: DirFingerprint):
+        with self._lock:
+            self.staged[rel_dir] = fp
+
+    def forget(self, rel_dir: str):
+        with self._lock:
+            self.staged.pop(rel_dir, None)
+            self.forgotten.add(rel_dir)
+
+    def fail(self, rel_dir: str):
+        """A scan below rel_dir failed: drop its fingerprints (and its children's), so the
+           next run lists it again, and do not count this run as a full rescan."""
+        prefix = rel_dir + '/'
+        with self._lock:
+            for key in [k for k in self.staged if k == rel_dir or k.startswith(prefix)]:
+                del self.staged[key]
+            self.forgotten.add(rel_dir)
+            self.failed.add(rel_dir)
+
+    def commit(self, failed_paths: Iterable[str]):
+        """Persist staged fingerprints; dirs with a failed copy below them stay unprunable."""
+        if self.manifest is None:
+            return
+        failed = list(failed_paths)
+        failed_dirs = set()   # every folder above a failed (or queued) path
+        for p in failed:
+            parts = p.split('/')[:-1]
+            failed_dirs.update('/'.join(parts[:i]) for i in range(1, len(parts) + 1))
+        conn = self.manifest.conn
+        for rel_dir in self.forgotten:
+            conn.execute("DELETE FROM dirs WHERE rel_dir = ? OR parent = ?", (rel_dir, rel_dir))
+        for rel_dir, fp in self.staged.items():
+            if rel_dir in failed_dirs:
+                fp.mtime = None  # keep it listed as a child, but rescan next run
+            conn.execute(
+                "INSERT OR REPLACE INTO dirs (rel_dir, parent, mtime, entries, total_size) "
+                "VALUES (?, ?, ?, ?, ?)", (rel_dir, fp.parent, fp.mtime, fp.entries, fp.total_size))
+        if self.full_rescan and not failed and not self.failed:
+            self.manifest.set_meta('last_full_scan', str(time.time()))
+        self.manifest.save()
 
 
 def _norm_rel_path(*parts: Path | str) -> str:
@@ -99,127 +232,785 @@ def _norm_rel_path(*parts: Path | str) -> str:
     return p.as_posix()
 
 
-def list_video_files(cam_root: Path, video_exts: Iterable[str]) -> List[Path]:
-    """Recursively list files under cam_root with any of the extensions (case-insensitive)."""
-    out: List[Path] = []
-    exts = tuple(e.lower() if e.startswith('.') else f".{e.lower()}" for e in video_exts)
-    for root, _, files in os.walk(cam_root):
-        rpath = Path(root)
-        for fname in files:
-            if fname.lower().endswith(exts):
-                out.append(rpath / fname)
+def _location(path: Path, dest_root: Path) -> str:
+    """Where a backed-up copy lives, as recorded in the manifest for `verify`."""
+    try:
+        return Path(os.path.relpath(path, dest_root)).as_posix()
+    except ValueError:  # different drive
+        return str(path)
+
+
+def _by_batch(rows: Iterable[PlanRow], dest_root: Path) -> Dict[Path, List[PlanRow]]:
+    """Group copied rows by the batch folder their dst is in (resumed copies finish in
+       the batch of the run that started them)."""
+    out: Dict[Path, List[PlanRow]] = {}
+    for row in rows:
+        out.setdefault(dest_root / _location(row.dst, dest_root).split('/', 1)[0], []).append(row)
     return out
 
 
-def discover_subjects(exp_dir: Path) -> List[Path]:
+def _catalog_rows(rows: Iterable[PlanRow], container: Path):
+    """Catalog FileRows for rows copied below `container` (a batch folder or the store root)."""
+    for r in rows:
+        yield (r.rel_path, container, _location(r.dst, container), r.size, r.mtime,
+               r.digest or (r.sample and f"sample:{r.sample}"))
+
+
+def _sampler(src: Path, size: int):
+    """Lazy sample hash for Manifest.needs_copy; an unreadable file counts as changed."""
+    def _sample() -> str:
+        try:
+            return integrity.sample_hash(src, size)
+        except OSError:
+            return ""
+    return _sample
+
+
+def list_video_files(cam_root: Path, video_exts: Iterable[str], subdirs: List[Path] | None = None) -> List[Path]:
+    """Recursively list files under cam_root with any of the extensions (case-insensitive).
+       Directories found below cam_root are appended to `subdirs` if given."""
+    match = discovery.Matcher(video_exts, VIDEO_EXCLUDE)
+    return [Path(e.path) for e in discovery.walk_files(cam_root, match, subdirs)]
+
+
+def discover_subjects(exp_dir: Path, tree: discovery.LiveTree = discovery.LIVE) -> List[Path]:
     """Find subject dirs (pattern __YYYYMMDD_XXXXX) under exp_dir/included. 
        Also supports subjects directly under exp_dir if needed."""
-    candidates: List[Path] = []
-    included = exp_dir / "included"
-    if included.is_dir():
-        for p in included.iterdir():
-            if p.is_dir() and SUBJ_REGEX.match(p.name):
-                candidates.append(p)
+    return discovery.discover_subjects(exp_dir, SUBJ_REGEX, fallback=True, tree=tree)
+
+
+def _scan_subject(exp_dir: Path, subj_dir: Path, dir_cache: DirCache,
+                  stats: PhaseStats | None = None,
+                  tree: discovery.LiveTree = discovery.LIVE,
+                  manifest: Manifest | None = None
+                  ) -> Tuple[List[Tuple[str, Path, int, float, str | None]], List[Tuple[str, DirFingerprint]]]:
+    """List and stat the video files of one subject: (rel_path, src, size, mtime, sample),
+       plus the fresh fingerprints of the folders listed, for the caller to stage once every
+       row is planned. Runs on a scan worker thread: it only reads the manifest, to take
+       the sample hashes needs_copy will ask for (SAMPLE_CHECK) here, in parallel."""
+    out: List[Tuple[str, Path, int, float, str | None]] = []
+    staged: List[Tuple[str, DirFingerprint]] = []
+    stats = stats or PhaseStats("unused")
+    rel_subj = _norm_rel_path(exp_dir.name, subj_dir.name)
+
+    # camera dirs directly under subject
+    subj_mtime = tree.stat(subj_dir).st_mtime
+    stats.add_stats()
+    if dir_cache.unchanged(rel_subj, subj_mtime):
+        cam_names = dir_cache.cached_children(rel_subj)
     else:
-        # fallback: look one level under exp_dir (rare, but safe)
-        for p in exp_dir.iterdir():
-            if p.is_dir() and SUBJ_REGEX.match(p.name):
-                candidates.append(p)
-    return candidates
+        cam_names = [p.name for p in tree.list_dirs(subj_dir, CAM_DIR_REGEX)]
+        staged.append((rel_subj, DirFingerprint(exp_dir.name, subj_mtime, len(cam_names), 0)))
 
+    for cam_name in cam_names:
+        cam_dir = subj_dir / cam_name
+        rel_cam = f"{rel_subj}/{cam_name}"
+        stats.add_stats()
+        try:
+            cam_mtime = tree.stat(cam_dir).st_mtime
+        except FileNotFoundError:
+            dir_cache.forget(rel_cam)
+            continue
+        if dir_cache.unchanged(rel_cam, cam_mtime):
+            continue
 
-def plan_copies(multiwork_root: Path, batch_dir: Path, manifest: Manifest) -> List[PlanRow]:
-    """Scan all experiments/subjects/cams and produce copy plan for new/changed files."""
-    plan: List[PlanRow] = []
+        subdirs: List[Path] = []
+        entries = 0
+        total_size = 0
+        for entry in tree.walk_files(cam_dir, VIDEO_MATCH, subdirs):
+            stats.add_stats()
+            try:
+                stat = entry.stat()  # cached by scandir on Windows
+                size = int(stat.st_size)
+                mtime = float(stat.st_mtime)
+            except FileNotFoundError:
+                continue  # file vanished mid-scan
+            entries += 1
+            total_size += size
+            stats.add_file(entry.path, size)
+            # rel path below cam root
+            rel_path = f"{rel_cam}/{discovery.rel_posix(entry.path, cam_dir)}"
+            sample = None
+            if (SAMPLE_CHECK and manifest is not None
+                    and manifest.sample_wanted(rel_path, size, mtime, RECHECK_UNCHANGED)):
+                sample = _sampler(Path(entry.path), size)()
+            out.append((rel_path, Path(entry.path), size, mtime, sample))
+        # a nested folder's changes do not bump cam_dir's mtime, so never prune those
+        staged.append((rel_cam, DirFingerprint(rel_subj, None if subdirs else cam_mtime, entries, total_size)))
+    return out, staged
+
+
+def iter_plan(multiwork_root: Path, batch_dir: Path, manifest: Manifest,
+              dir_cache: DirCache | None = None, workers: int = SCAN_WORKERS,
+              stats: PhaseStats | None = None,
+              tree: discovery.LiveTree = discovery.LIVE) -> Iterator[PlanRow]:
+    """Scan all experiments/subjects/cams and yield copy plan rows for new/changed files.
+
+    Experiments and subjects are listed concurrently, and the scan workers
+    read the sample hashes the comparison needs; the manifest comparison
+    and dedup stay on the consuming thread as each subject's scan completes.
+    Rows are produced lazily, so at most a few subjects are scanned ahead of
+    the consumer. `stats` gets the scan's wall time (which overlaps copying),
+    files and bytes seen, stat calls and scan errors. With an Inventory as
+    `tree` the listings come from the shared scan instead of the share.
+    """
+    seen = set()
+    dir_cache = dir_cache or DirCache(None)
+    stats = stats or PhaseStats("unused")
+    stats.start()
+
+    experiments = discovery.discover_experiments(multiwork_root, EXP_REGEX, tree)
+    logger.info(f"Scanning experiments... found {len(experiments)}")
+
+    def _subjects():
+        for exp_dir, subjects, err in discovery.stream_map(lambda exp: discover_subjects(exp, tree), experiments,
+                                                           workers):
+            if err is not None:
+                stats.add_error()
+                logger.warning(f"Could not list {exp_dir}: {err}")
+            elif not subjects:
+                logger.warning(f"No subjects found in: {exp_dir}")
+            else:
+                yield from ((exp_dir, subj_dir) for subj_dir in subjects)
+
+    scans = discovery.stream_map(lambda job: _scan_subject(*job, dir_cache, stats, tree, manifest), _subjects(),
+                                 workers)
+    try:
+        for (exp_dir, subj_dir), result, err in scans:
+            if err is not None:
+                stats.add_error()
+                # none of the subject's rows are planned, so none of its folders may be pruned next run
+                dir_cache.fail(_norm_rel_path(exp_dir.name, subj_dir.name))
+            if isinstance(err, PermissionError):
+                logger.warning(f"Permission error in {subj_dir}: {err}")
+                continue
+            if err is not None:
+                logger.warning(f"Scan failed in {subj_dir}: {err}")
+                continue
+            files, staged = result
+            for rel_path, src, size, mtime, sample in files:
+                # Deduplicate by rel_path (keep first occurrence)
+                if rel_path in seen:
+                    continue
+                seen.add(rel_path)
+                if sample is not None:   # taken by the scan worker
+                    sampler = lambda sample=sample: sample
+                else:
+                    sampler = _sampler(src, size) if SAMPLE_CHECK else None
+                if manifest.needs_copy(rel_path, size, mtime, sampler, RECHECK_UNCHANGED):
+                    dst = batch_dir / Path(rel_path)  # preserve structure
+                    yield PlanRow(rel_path=rel_path, size=size, mtime=mtime, src=src, dst=dst)
+            # only reached once the consumer took every row of the subject
+            for rel_dir, fp in staged:
+                dir_cache.stage(rel_dir, fp)
+    finally:   # also when the consumer stops early (copy window closed)
+        scans.close()
+        stats.stop()
+        if dir_cache.pruned:
+            logger.info(f"Skipped {dir_cache.pruned} unchanged subject/cam folders")
+
+
+def plan_copies(multiwork_root: Path, batch_dir: Path, manifest: Manifest,
+                dir_cache: DirCache | None = None, workers: int = SCAN_WORKERS,
+                stats: PhaseStats | None = None,
+                tree: discovery.LiveTree = discovery.LIVE) -> List[PlanRow]:
+    """Materialised copy plan (see iter_plan)."""
+    return list(iter_plan(multiwork_root, batch_dir, manifest, dir_cache, workers, stats, tree))
+
+
+def _subject_date(rel_path: str) -> int:
+    """YYYYMMDD of the __YYYYMMDD_XXXXX subject a row belongs to, 0 if none."""
+    for part in rel_path.split('/'):
+        if SUBJ_REGEX.match(part):
+            return int(part[2:10])
+    return 0
+
+
+class CopyQueue:
+    """Rows a run did not get to, persisted so the next run copies them first.
+
+    Only rel_paths and source paths are kept: each queued file is stat'ed
+    again and compared with the manifest, so a queued file that changed,
+    vanished or was backed up meanwhile is handled like any other. A path
+    of None disables persistence (dry runs).
+    """
+
+    def __init__(self, path: Path | None, rel_paths: List[str] | None = None, sources: List[str] | None = None):
+        self.path = path
+        self.rank = {rel: i for i, rel in enumerate(rel_paths or [])}
+        self.sources = dict(zip(rel_paths or [], sources or []))
 
-    experiments = [p for p in multiwork_root.iterdir() if p.is_dir() and EXP_REGEX.match(p.name)]
-    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Scanning experiments... found {len(experiments)}")
+    @staticmethod
+    def load(path: Path | None) -> "CopyQueue":
+        if path is None or not path.exists():
+            return CopyQueue(path)
+        try:
+            with path.open('r', encoding='utf-8') as f:
+                saved = json.load(f)
+            return CopyQueue(path, saved['rel_paths'], saved.get('sources'))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable copy queue {path}: {e}")
+            return CopyQueue(path)
+
+    def first(self, plan: Iterable[PlanRow], batch_dir: Path, manifest: Manifest,
+              tree: discovery.LiveTree = discovery.LIVE) -> Iterator[PlanRow]:
+        """Queued files that still need copying, in their saved order, then the streamed
+           `plan` without them. Only the queued files are stat'ed up front, so the scan
+           and the copies still overlap."""
+        carried = set()
+        for rel_path, src in sorted(self.sources.items(), key=lambda item: self.rank[item[0]]):
+            src = Path(src)
+            try:
+                st = tree.stat(src)
+            except OSError:
+                continue   # gone or unreadable: the scan decides
+            sampler = _sampler(src, st.st_size) if SAMPLE_CHECK else None
+            carried.add(rel_path)
+            if manifest.needs_copy(rel_path, st.st_size, st.st_mtime, sampler, RECHECK_UNCHANGED):
+                yield PlanRow(rel_path=rel_path, size=st.st_size, mtime=st.st_mtime, src=src,
+                              dst=batch_dir / Path(rel_path))
+        if carried:
+            logger.info(f"{len(carried)} files carried over from the last run went first")
+        try:
+            yield from (row for row in plan if row.rel_path not in carried)
+        finally:
+            close = getattr(plan, "close", None)
+            if close is not None:
+                close()   # pass an early stop on to the scan
+
+    def prioritize(self, plan: Iterable[PlanRow], manifest: Manifest) -> List[PlanRow]:
+        """Queued rows in their saved order, then never-backed-up files, newest subject, smallest."""
+        def _key(row: PlanRow):
+            queued = self.rank.get(row.rel_path)
+            if queued is not None:
+                return (0, queued)
+            return (1, manifest.known(row.rel_path), -_subject_date(row.rel_path), row.size)
+        return sorted(plan, key=_key)
+
+    def save(self, leftover: List[PlanRow]):
+        """Replace the queue with `leftover`; an empty queue removes the file."""
+        if self.path is None:
+            return
+        if not leftover:
+            self.path.unlink(missing_ok=True)
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open('w', encoding='utf-8') as f:
+            json.dump({'created': time.time(), 'bytes': sum(r.size for r in leftover),
+                       'rel_paths': [r.rel_path for r in leftover],
+                       'sources': [str(r.src) for r in leftover]}, f)
+        os.replace(tmp, self.path)
+
+
+class OutOfWindow(Exception):
+    """Raised by a copy worker for a row that was queued but not started before the deadline."""
+
+
+class CopyWindow:
+    """Stops handing out rows at a wall-clock deadline or once a byte budget is under way.
+
+    Copies already running finish normally; rows pulled but not started are
+    collected in `leftover` (in plan order) for the caller to queue for the
+    next run. The rest of a lazy plan is not consumed, so the scan stops too;
+    the next run lists those folders again (their fingerprints are not staged).
+    """
+
+    def __init__(self, deadline: float | None = None, byte_budget: int = 0):
+        self.deadline = deadline   # epoch seconds
+        self.byte_budget = byte_budget
+        self.admitted_bytes = 0
+        self.reason: str | None = None
+        self.rejected: List[PlanRow] = []    # pulled by the pool, stopped before starting
+        self.remaining: List[PlanRow] = []   # the row that hit the limit
+        self._order: Dict[str, int] = {}     # rel_path -> position in the plan
 
-    for exp_dir in experiments:
-        subjects = discover_subjects(exp_dir)
-        if not subjects:
-            print(f"[WARN] No subjects found in: {exp_dir}")
+    @staticmethod
+    def until(hhmm: str | None, byte_budget: int = 0, now: datetime | None = None) -> "CopyWindow":
+        """Window ending at the next local HH:MM (today, or tomorrow if that has passed)."""
+        if not hhmm:
+            return CopyWindow(None, byte_budget)
+        now = now or datetime.now()
+        hour, minute = (int(x) for x in hhmm.split(':'))
+        end = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if end <= now:
+            end += timedelta(days=1)
+        return CopyWindow(end.timestamp(), byte_budget)
+
+    @property
+    def leftover(self) -> List[PlanRow]:
+        return sorted(self.rejected, key=lambda r: self._order[r.rel_path]) + self.remaining
+
+    def expired(self) -> bool:
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.reason = self.reason or "deadline"
+        return self.reason == "deadline"
+
+    def admit(self, plan: Iterable[PlanRow]) -> Iterator[PlanRow]:
+        for row in plan:
+            if self.expired() or (self.byte_budget and self.admitted_bytes >= self.byte_budget):
+                self.reason = self.reason or "byte budget"
+                self.remaining.append(row)
+                close = getattr(plan, "close", None)
+                if close is not None:
+                    close()   # stop the scan behind a lazy plan
+                return
+            self._order[row.rel_path] = len(self._order)
+            self.admitted_bytes += row.size
+            yield row
+
+    def check(self, row: PlanRow):
+        """Called by a worker right before copying `row`."""
+        if self.expired():
+            raise OutOfWindow(row.rel_path)
+
+
+class Throttle:
+    """Token bucket shared by all workers to cap aggregate bytes/sec (0 = unlimited)."""
+
+    def __init__(self, bytes_per_sec: int):
+        self.rate = bytes_per_sec
+        self._lock = threading.Lock()
+        self._allowance = float(bytes_per_sec)
+        self._last = time.monotonic()
+
+    def consume(self, nbytes: int):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate)
+            self._last = now
+            self._allowance -= nbytes
+            wait = -self._allowance / self.rate if self._allowance < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _volume_key(path: Path) -> str:
+    """Identify the destination volume: drive/UNC share on Windows, device id elsewhere."""
+    if path.drive:
+        return path.drive.lower()
+    for p in (path, *path.parents):
+        try:
+            return str(p.stat().st_dev)
+        except OSError:
             continue
+    return path.anchor
 
-        for subj_dir in subjects:
-            # camera dirs directly under subject
-            try:
-                for cam_dir in subj_dir.iterdir():
-                    if cam_dir.is_dir() and CAM_DIR_REGEX.match(cam_dir.name):
-                        files = list_video_files(cam_dir, VIDEO_EXTS)
-                        for src in files:
-                            # rel path below cam root
-                            rel_under_cam = src.relative_to(cam_dir)
-                            rel_path = _norm_rel_path(exp_dir.name, subj_dir.name, cam_dir.name, rel_under_cam)
-
-                            try:
-                                stat = src.stat()
-                                size = int(stat.st_size)
-                                mtime = float(stat.st_mtime)
-                            except FileNotFoundError:
-                                continue  # file vanished mid-scan
-
-                            if manifest.needs_copy(rel_path, size, mtime):
-                                dst = batch_dir / Path(rel_path)  # preserve structure
-                                plan.append(PlanRow(rel_path=rel_path, size=size, mtime=mtime, src=src, dst=dst))
-            except PermissionError as e:
-                print(f"[WARN] Permission error in {subj_dir}: {e}")
-                continue
 
-    # Deduplicate by rel_path (keep first occurrence)
-    seen = set()
-    deduped: List[PlanRow] = []
-    for row in plan:
-        if row.rel_path not in seen:
-            seen.add(row.rel_path)
-            deduped.append(row)
-    return deduped
+class CopyJournal:
+    """Append-only JSONL journal of finished rows and partial-copy offsets.
 
+    Lines are either {"op": "done", rel_path, size, mtime, dst, digest, sample}
+    or {"op": "part", rel_path, size, mtime, dst, offset}; the last line per
+    rel_path wins. A path of None disables journaling (dry runs).
+    """
 
-def execute_copies(plan: List[PlanRow], manifest: Manifest, dry_run: bool) -> Counters:
-    cnt = Counters()
-    for row in plan:
-        row.dst.parent.mkdir(parents=True, exist_ok=True)
+    def __init__(self, path: Path | None):
+        self.path = path
+        self.done: Dict[str, dict] = {}
+        self.partials: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._fh = None
+
+    @staticmethod
+    def load(path: Path | None) -> "CopyJournal":
+        j = CopyJournal(path)
+        if path is not None and path.exists():
+            with path.open('r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    j._apply(rec)
+        return j
+
+    def _apply(self, rec: dict):
+        rel = rec.get('rel_path')
+        if not rel:
+            return
+        if rec.get('op') == 'done':
+            self.done[rel] = rec
+            self.partials.pop(rel, None)
+        elif rec.get('op') == 'part':
+            self.partials[rel] = rec
+
+    def _write(self, rec: dict, sync: bool = False):
+        if self.path is None:
+            return
+        with self._lock:
+            self._apply(rec)
+            if self._fh is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._fh = self.path.open('a', encoding='utf-8')
+            self._fh.write(json.dumps(rec) + "\n")
+            self._fh.flush()
+            if sync:
+                os.fsync(self._fh.fileno())
+
+    def record_progress(self, row: "PlanRow", offset: int):
+        self._write({'op': 'part', 'rel_path': row.rel_path, 'size': row.size, 'mtime': row.mtime,
+                     'dst': str(row.dst), 'offset': offset}, sync=True)
+
+    def record_done(self, row: "PlanRow"):
+        self._write({'op': 'done', 'rel_path': row.rel_path, 'size': row.size, 'mtime': row.mtime,
+                     'dst': str(row.dst), 'digest': row.digest, 'sample': row.sample})
+
+    def resume_point(self, row: "PlanRow") -> Tuple[Path, int] | None:
+        """Return (dst, offset) of a partial copy of this exact source version, if any."""
+        rec = self.partials.get(row.rel_path)
+        if not rec or int(rec['size']) != row.size or float(rec['mtime']) != row.mtime:
+            return None
+        dst = Path(rec['dst'])
+        part = dst.with_name(dst.name + PART_SUFFIX)
         try:
-            if not dry_run:
-                shutil.copy2(row.src, row.dst)  # preserves timestamps
-            cnt.copied_ok += 1
-            manifest.upsert(row.rel_path, row.size, row.mtime)
+            have = part.stat().st_size
+        except OSError:
+            return None
+        return dst, min(int(rec['offset']), have)
+
+    def apply_completed(self, manifest: "Manifest") -> int:
+        """Fold rows finished by an interrupted run into the manifest."""
+        for rel_path, rec in self.done.items():
+            location = _location(Path(rec['dst']), self.path.parent) if rec.get('dst') else None
+            manifest.upsert(rel_path, int(rec['size']), float(rec['mtime']),
+                            rec.get('digest'), rec.get('sample'), location)
+        return len(self.done)
+
+    def compact(self):
+        """After the manifest is saved, keep only partials that can still be resumed."""
+        if self.path is None:
+            return
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            self.done.clear()
+            if not self.partials:
+                self.path.unlink(missing_ok=True)
+                return
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with tmp.open('w', encoding='utf-8') as f:
+                for rec in self.partials.values():
+                    f.write(json.dumps(rec) + "\n")
+            os.replace(tmp, self.path)
+
+
+class CatalogFeed:
+    """Copied batch rows -> the catalog, CATALOG_BATCH rows per transaction as copies
+    complete, so a long run never holds its file list in memory. Each batch folder is
+    its own catalog run (resumed and recovered rows go to the run that started them).
+
+    The catalog is optional: a failure to open or write it is logged once and the
+    feed stops; the backup is unaffected. A path of None disables it (dry runs).
+    """
+
+    def __init__(self, path: Path | None, dest_root: Path, batch_size: int = CATALOG_BATCH):
+        self.dest_root = dest_root
+        self.batch_size = batch_size
+        self.catalog: Catalog | None = None
+        self.pending: List[PlanRow] = []
+        self.recorded: Dict[str, int] = {}   # run -> files recorded for it so far
+        if path is not None:
+            try:
+                self.catalog = Catalog.open(path)
+            except Exception as e:
+                self._disable(e)
+
+    def _disable(self, err: Exception):
+        logger.warning(f"Could not update catalog {CATALOG_PATH}: {err}")
+        if self.catalog is not None:
+            self.catalog.close()
+        self.catalog = None
+        self.pending.clear()
+
+    def add(self, rows: Iterable[PlanRow]):
+        if self.catalog is None:
+            return
+        self.pending.extend(rows)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.catalog is None or not self.pending:
+            return
+        try:
+            for batch, rows in _by_batch(self.pending, self.dest_root).items():
+                run = f"video_{batch.name}"
+                self.recorded[run] = self.catalog.add_run(run, "video", "batch", _catalog_rows(rows, batch),
+                                                          replace=False)
+        except Exception as e:
+            self._disable(e)
+        self.pending.clear()
+
+    def add_snapshot(self, name: str, rows: List[PlanRow], store_root: Path):
+        """Record a written store snapshot's copied rows as one catalog run."""
+        if self.catalog is None:
+            return
+        try:
+            self.recorded[name] = self.catalog.add_run(name, "video", "store", _catalog_rows(rows, store_root))
         except Exception as e:
+            self._disable(e)
+
+    def close(self):
+        self.flush()
+        for run, n in self.recorded.items():
+            logger.info(f"Catalog: {n} files recorded for {run}")
+        if self.catalog is not None:
+            self.catalog.close()
+            self.catalog = None
+
+
+def _copy_resumable(row: PlanRow, journal: CopyJournal, throttle: Throttle):
+    """Chunked copy into dst + PART_SUFFIX, resuming a journaled offset, then atomic rename.
+       With FULL_HASH_ON_COPY the hashes are taken from the copy buffers; otherwise bytes
+       move in-kernel where the volumes allow it and only the sample hash is taken."""
+    offset = 0
+    resume = journal.resume_point(row)
+    if resume is not None:
+        row.dst, offset = resume
+    part = row.dst.with_name(row.dst.name + PART_SUFFIX)
+    part.parent.mkdir(parents=True, exist_ok=True)
+    hasher = integrity.StreamHasher(row.size) if FULL_HASH_ON_COPY else None
+    if offset and hasher is not None:
+        hasher.feed_file(part, offset)
+
+    # throttled runs ask for tokens one buffer at a time; otherwise move a checkpoint per call
+    step = COPY_BUFFER_SIZE if throttle.rate > 0 else CHECKPOINT_BYTES
+    start, strategy = offset, "readinto"
+    with row.src.open('rb', buffering=0) as fsrc, part.open('r+b' if offset else 'wb', buffering=0) as fdst:
+        if offset:
+            fsrc.seek(offset)
+            fdst.seek(offset)
+            fdst.truncate()
+        unsynced = 0
+        while offset < row.size:
+            strategy = copier.copy_range(fsrc, fdst, min(step, row.size - offset),
+                                         tap=hasher.update if hasher else None)
+            n = fdst.tell() - offset
+            if not n:
+                break
+            throttle.consume(n)
+            offset += n
+            unsynced += n
+            if unsynced >= CHECKPOINT_BYTES:
+                os.fsync(fdst.fileno())
+                journal.record_progress(row, offset)
+                unsynced = 0
+    if offset != row.size:   # source shrank since the scan: never rename a truncated .part into place
+        raise OSError(errno.EIO, f"short copy ({strategy}): {offset} of {row.size} bytes", str(row.src))
+    shutil.copystat(row.src, part)  # preserves timestamps
+    if hasher is not None:
+        row.digest, row.sample = hasher.digests()
+    else:
+        row.digest, row.sample = None, integrity.sample_hash(row.src, row.size)
+    os.replace(part, row.dst)
+    copier.record(strategy, offset - start)
+    journal.record_done(row)
+
+
+def execute_copies(plan: Iterable[PlanRow], manifest: Manifest, dry_run: bool,
+                   workers: int = COPY_WORKERS, per_volume: int = MAX_PER_VOLUME,
+                   bytes_per_sec: int = MAX_BYTES_PER_SEC,
+                   journal: CopyJournal | None = None,
+                   sink: SnapshotWriter | None = None,
+                   dest_root: Path | None = None,
+                   stats: PhaseStats | None = None,
+                   window: CopyWindow | None = None,
+                   catalog: CatalogFeed | None = None) -> Counters:
+    """Copy plan rows on a bounded thread pool.
+
+    `plan` may be a lazy stream (iter_plan): rows are pulled only as copy
+    slots free up, which is the backpressure on the scan. Workers only move
+    bytes; the manifest and counters are updated on the calling thread as
+    copies complete, so no locking is needed around them.
+
+    With a `sink`, rows go into the dedup store instead and the manifest is
+    left alone: the caller upserts cnt.deferred once the snapshot is written,
+    so a crash never leaves manifest rows that no snapshot references.
+    Copy locations are recorded relative to `dest_root` when it is given.
+    Per-file copy times, bytes and errors go into `stats` if given.
+    With a `window`, no new copy starts after its deadline or byte budget;
+    the rows left over are in window.leftover, not counted as failures.
+    Batch copies are passed to `catalog` as they complete.
+    """
+    cnt = Counters()
+    stats = stats or PhaseStats("unused")
+    journal = journal or CopyJournal(None)
+    throttle = Throttle(bytes_per_sec)
+    vol_lock = threading.Lock()
+    vol_slots: Dict[str, threading.Semaphore] = {}
+
+    def _slot(dst: Path) -> threading.Semaphore:
+        key = _volume_key(dst)
+        with vol_lock:
+            if key not in vol_slots:
+                vol_slots[key] = threading.Semaphore(max(1, per_volume))
+            return vol_slots[key]
+
+    def _copy_one(row: PlanRow) -> float:
+        if window is not None:
+            window.check(row)
+        t0 = time.monotonic()
+        _copy_row(row)
+        seconds = time.monotonic() - t0
+        stats.add_file(row.rel_path, row.size, seconds)
+        return seconds
+
+    def _copy_row(row: PlanRow):
+        if dry_run:
+            row.dst.parent.mkdir(parents=True, exist_ok=True)
+            return
+        if sink is not None:
+            with _slot(sink.store.root):
+                row.digest = sink.put(row.src, row.dst)[0]
+            row.sample = integrity.sample_hash(row.src, row.size)
+            row.dst = sink.store.blob_path(row.digest)
+            return
+        with _slot(row.dst):
+            _copy_resumable(row, journal, throttle)
+
+    start = time.monotonic()
+    stats.start()
+    tally = DirTally()
+    if window is not None:
+        plan = window.admit(plan)
+    for row, seconds, err in discovery.stream_map(_copy_one, plan, workers):
+        if isinstance(err, OutOfWindow):
+            window.rejected.append(row)
+            continue
+        tally.add(row.rel_path.rsplit("/", 1)[0], "copied" if err is None else "failed",
+                  row.size if err is None else 0)
+        if err is None:
+            file_event(logger, "would_copy" if dry_run else "copied", row.src, row.dst, row.size, seconds)
+            cnt.copied_ok += 1
+            cnt.bytes_copied += row.size
+            if not dry_run and sink is not None:
+                cnt.deferred.append(row)
+            elif not dry_run:
+                location = _location(row.dst, dest_root) if dest_root else None
+                manifest.upsert(row.rel_path, row.size, row.mtime, row.digest, row.sample, location)
+                if catalog is not None:
+                    catalog.add([row])
+        else:
             cnt.failed += 1
-            print(f"[WARN] Copy failed: {row.src} -> {row.dst} ({e})")
+            stats.add_error()
+            cnt.failed_paths.append(row.rel_path)
+            file_event(logger, "failed", row.src, row.dst, row.size, error=str(err))
+    cnt.elapsed = time.monotonic() - start
+    tally.emit(logger)
+    stats.stop()
     return cnt
 
 
-def main():
+def main(tree: discovery.LiveTree = discovery.LIVE):
+    """Run the video backup; `tree` may be a shared Inventory (see backup_runner.py)."""
     if not MULTIWORK_ROOT.is_dir():
-        print(f"[ERROR] Multiwork root not found: {MULTIWORK_ROOT}")
+        logger.error(f"Multiwork root not found: {MULTIWORK_ROOT}")
         sys.exit(1)
 
     DEST_ROOT.mkdir(parents=True, exist_ok=True)
-    manifest_path = DEST_ROOT / "manifest.csv"
+    manifest_path = DEST_ROOT / "manifest.sqlite"
+    run_log = RunLog("video")
+    metrics = RunMetrics("video")
 
     # single timestamped batch folder per run
     batch_dir = DEST_ROOT / datetime.now().strftime("%Y%m%d_%H%M%S")
-    batch_dir.mkdir(parents=True, exist_ok=True)
-
-    # load manifest
-    manifest = Manifest.load(manifest_path)
-
-    # plan
-    plan = plan_copies(MULTIWORK_ROOT, batch_dir, manifest)
-    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Files to copy: {len(plan)}")
-
-    # execute
-    counters = execute_copies(plan, manifest, DRY_RUN)
-
-    # save manifest
+    store = sink = None
+    if STORE_MODE and not DRY_RUN:
+        store = BlobStore(DEDUP_STORE_ROOT)
+        sink = SnapshotWriter(store, f"video_{batch_dir.name}", root=batch_dir,
+                              parent=store.latest_snapshot("video_"))
+    else:
+        batch_dir.mkdir(parents=True, exist_ok=True)
+
+    # load manifest, then fold in rows finished by an interrupted previous run (catalog too,
+    # so restores do not have to search the batches)
+    manifest = Manifest.open(manifest_path, legacy_csv=DEST_ROOT / "manifest.csv", read_only=DRY_RUN)
+    journal = CopyJournal.load(None if DRY_RUN else DEST_ROOT / "copy_journal.jsonl")
+    catalog = CatalogFeed(None if DRY_RUN else CATALOG_PATH, DEST_ROOT)
+    catalog.add(PlanRow(rec['rel_path'], int(rec['size']), float(rec['mtime']), Path(), Path(rec['dst']),
+                        rec.get('digest'), rec.get('sample')) for rec in journal.done.values() if rec.get('dst'))
+    resumed = journal.apply_completed(manifest)
+    if resumed or journal.partials:
+        logger.info(f"Journal: {resumed} completed rows recovered, "
+                    f"{len(journal.partials)} partial copies to resume")
+
+    # plan, pruning folders whose fingerprint is unchanged since the last clean run
+    # in-place edits do not touch folder mtimes, so a re-check must not prune folders
+    dir_cache = DirCache(manifest, full_rescan=FORCE_FULL_RESCAN or RECHECK_UNCHANGED)
+    if dir_cache.full_rescan:
+        logger.info("Full rescan (directory fingerprints ignored)")
+    plan = iter_plan(MULTIWORK_ROOT, batch_dir, manifest, dir_cache, stats=metrics.phase("scan"), tree=tree)
+
+    # priority order needs the whole plan; otherwise the queued files go first and the
+    # rest is copied while the scan is still running
+    queue = CopyQueue.load(None if DRY_RUN else DEST_ROOT / "copy_queue.json")
+    if PRIORITY_ORDER:
+        plan = queue.prioritize(plan, manifest)
+        logger.info(f"Planned {len(plan)} files, {sum(r.size for r in plan) / 1e9:.2f} GB "
+                    f"({sum(r.rel_path in queue.rank for r in plan)} carried over from the last run)")
+    else:
+        plan = queue.first(plan, batch_dir, manifest, tree)
+    window = CopyWindow.until(COPY_DEADLINE, COPY_BYTE_BUDGET)
+    counters = execute_copies(plan, manifest, DRY_RUN, journal=journal, sink=sink, dest_root=DEST_ROOT,
+                              stats=metrics.phase("copy"), window=window, catalog=catalog)
+    logger.info(f"Files to copy: {counters.copied_ok + counters.failed + len(window.leftover)}")
+    leftover = window.leftover
+    if leftover:
+        logger.warning(f"Stopped at the {window.reason}: {len(leftover)} files, "
+                       f"{sum(r.size for r in leftover) / 1e9:.2f} GB left for the next run")
+
+    # store mode: snapshot first, then let the manifest remember what it references
+    finalize = metrics.phase("finalize")
+    finalize.start()
+    if sink is not None:
+        if sink.count:
+            logger.info(f"Snapshot written: {sink.close()[0]}")
+            for row in counters.deferred:
+                manifest.upsert(row.rel_path, row.size, row.mtime, row.digest, row.sample,
+                                _location(row.dst, DEST_ROOT))
+        logger.info(f"Store: {store.bytes_written / 1e9:.2f} GB new, "
+                    f"{store.bytes_deduped / 1e9:.2f} GB deduplicated")
+        metrics.info.update(store_bytes_written=store.bytes_written, store_bytes_deduped=store.bytes_deduped)
+        store.close()
+
+    # save manifest; the journal then only needs to remember unfinished partials
     if not DRY_RUN:
-        manifest.save(manifest_path)
-
-    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Incremental backup done. "
-          f"Copied OK: {counters.copied_ok}, Failed: {counters.failed}, "
-          f"Batch folder: {batch_dir}")
+        # queued files are not backed up yet, so their folders must not be pruned next run
+        dir_cache.commit(counters.failed_paths + [r.rel_path for r in leftover])
+        manifest.save()
+        journal.compact()
+        queue.save(leftover)
+    manifest.close()
+
+    # batch copies were catalogued as they completed; a store snapshot's rows once it is written
+    if sink is not None and counters.deferred:
+        catalog.add_snapshot(sink.name, counters.deferred, store.root)
+    catalog.close()
+    finalize.stop()
+
+    logger.info(f"Incremental backup done. "
+                f"Copied OK: {counters.copied_ok}, Failed: {counters.failed}, "
+                f"{counters.bytes_copied / 1e9:.2f} GB in {counters.elapsed:.1f}s "
+                f"({counters.mb_per_sec:.1f} MB/s), "
+                f"Destination: {DEDUP_STORE_ROOT if sink is not None else batch_dir}")
+
+    metrics.info.update(dry_run=DRY_RUN, store_mode=sink is not None, batch=batch_dir.name,
+                        pruned_dirs=dir_cache.pruned, resumed_rows=resumed, copied_ok=counters.copied_ok,
+                        failed=counters.failed, failed_paths=counters.failed_paths[:100],
+                        stop_reason=window.reason, queued=len(leftover),
+                        queued_bytes=sum(r.size for r in leftover),
+                        copy_strategies=copier.report())
+    logger.info(f"Copy: {copier.summary()}")
+    logger.info(f"Timing: {metrics.summary()}")
+    if not DRY_RUN:
+        try:
+            logger.info(f"Run report: {metrics.write(DEST_ROOT / 'reports')}")
+        except OSError as e:
+            logger.warning(f"Could not write run report: {e}")
+    run_log.close(publish_to=None if DRY_RUN else DEST_ROOT / "reports")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+CHANGE DETECTION AND VERIFICATION for the scheduled backup scripts.
+- Tier 1: size/mtime from the scan (free).
+- Tier 2: a sample hash over the head, middle and tail blocks of a file (a few MB,
+  whatever the file size), used when size matches but mtime moved, or when the
+  caller asks to re-check unchanged files. Small files are sampled whole.
+- Tier 3: a full SHA-256 computed while the file is being copied (no second read)
+  and stored in the manifest next to the sample.
+- `verify` re-hashes backed-up copies against the manifest, and CRC-checks zip
+  archives, on a thread pool:
+    python backup_integrity.py verify <dest_root> [--sample] [--workers 8]
+"""
+
+import sys
+import sqlite3
+import hashlib
+import zipfile
+import argparse
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple
+
+import backup_discovery as discovery
+
+HASH_BUFFER_SIZE = 8 * 1024 * 1024
+SAMPLE_BLOCK     = 1024 * 1024   # bytes hashed at each of head / middle / tail
+VERIFY_WORKERS   = 8
+
+
+def sample_ranges(size: int, block: int = SAMPLE_BLOCK) -> List[Tuple[int, int]]:
+    """Byte ranges [start, end) covered by the sample hash, in file order."""
+    if size <= 3 * block:
+        return [(0, size)]
+    mid = (size - block) // 2
+    return [(0, block), (mid, mid + block), (size - block, size)]
+
+
+def _new_sample(size: int):
+    h = hashlib.sha256()
+    h.update(str(size).encode())  # a truncated or extended file never matches
+    return h
+
+
+def sample_hash(path: Path, size: int | None = None) -> str:
+    """Tier-2 hash: reads only the sampled ranges of path."""
+    if size is None:
+        size = path.stat().st_size
+    h = _new_sample(size)
+    with path.open('rb') as f:
+        for start, end in sample_ranges(size):
+            f.seek(start)
+            h.update(f.read(end - start))
+    return h.hexdigest()
+
+
+def full_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    buf = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buf)
+    with path.open('rb') as f:
+        while n := f.readinto(buf):
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+class StreamHasher:
+    """Full and sample hash of a file fed sequentially, e.g. from a copy loop.
+
+    update() must see every byte in order starting at offset 0; the sample is
+    taken from the same buffers, so neither hash costs an extra read.
+    """
+
+    def __init__(self, size: int):
+        self.full = hashlib.sha256()
+        self.sample = _new_sample(size)
+        self.ranges = sample_ranges(size)
+        self.offset = 0
+
+    def update(self, data: memoryview | bytes):
+        self.full.update(data)
+        start, end = self.offset, self.offset + len(data)
+        for a, b in self.ranges:
+            lo, hi = max(a, start), min(b, end)
+            if lo < hi:
+                self.sample.update(data[lo - start:hi - start])
+        self.offset = end
+
+    def feed_file(self, path: Path, nbytes: int):
+        """Catch up on the first nbytes already written to path (resumed copies)."""
+        buf = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buf)
+        with path.open('rb') as f:
+            while self.offset < nbytes:
+                n = f.readinto(view[:min(len(buf), nbytes - self.offset)])
+                if not n:
+                    raise OSError(f"{path} is shorter than its journaled offset")
+                self.update(view[:n])
+
+    def digests(self) -> Tuple[str, str]:
+        return self.full.hexdigest(), self.sample.hexdigest()
+
+
+# ---------------------------------------------------------------------
+# verify
+# ---------------------------------------------------------------------
+
+@dataclass
+class VerifyResult:
+    checked: int = 0
+    ok: int = 0
+    bytes_read: int = 0
+    missing: List[str] = field(default_factory=list)
+    corrupt: List[str] = field(default_factory=list)
+
+
+def _check_row(dest_root: Path, row: Tuple[str, str, int, str, str], sample_only: bool) -> Tuple[str | None, int]:
+    """Return (problem or None, bytes read) for one manifest row."""
+    rel_path, location, size, digest, sample = row
+    path = dest_root / location
+    try:
+        if path.stat().st_size != size:
+            return "corrupt", 0
+        if sample_only or digest is None:   # copies made in-kernel only record the sample
+            ok, nread = sample_hash(path, size) == sample, sum(b - a for a, b in sample_ranges(size))
+        else:
+            ok, nread = full_hash(path) == digest, size
+    except FileNotFoundError:
+        return "missing", 0
+    return (None if ok else "corrupt"), nread
+
+
+def verify_manifest(dest_root: Path, manifest_db: Path, sample_only: bool = False,
+                    workers: int = VERIFY_WORKERS) -> VerifyResult:
+    """Re-hash every manifest row that records a hash (full or sample) and a backup location."""
+    conn = sqlite3.connect(f"{manifest_db.resolve().as_uri()}?mode=ro", uri=True)
+    rows = conn.execute("SELECT rel_path, location, size, hash, sample FROM manifest "
+                        "WHERE (hash IS NOT NULL OR sample IS NOT NULL) AND location IS NOT NULL").fetchall()
+    conn.close()
+    res = VerifyResult()
+    for row, out, err in discovery.stream_map(lambda r: _check_row(dest_root, r, sample_only), rows, workers):
+        res.checked += 1
+        problem, nread = out if err is None else ("corrupt", 0)
+        res.bytes_read += nread
+        if problem is None:
+            res.ok += 1
+        else:
+            getattr(res, problem).append(row[0])
+            print(f"[WARN] {problem}: {row[0]} ({dest_root / row[1]})" + (f": {err}" if err else ""))
+    return res
+
+
+def verify_zips(dest_root: Path, workers: int = VERIFY_WORKERS) -> VerifyResult:
+    """CRC-check every member of every zip below dest_root."""
+    def _test(path: Path) -> str | None:
+        with zipfile.ZipFile(path) as zf:
+            return zf.testzip()
+
+    zips = sorted(dest_root.rglob("*.zip"))
+    res = VerifyResult()
+    for path, bad, err in discovery.stream_map(_test, zips, workers):
+        res.checked += 1
+        res.bytes_read += path.stat().st_size
+        if err is None and bad is None:
+            res.ok += 1
+        else:
+            res.corrupt.append(str(path))
+            print(f"[WARN] corrupt zip: {path}: {err or 'bad member ' + bad}")
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Verify backed-up files against their recorded hashes.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_verify = sub.add_parser("verify", help="re-check a backup destination")
+    p_verify.add_argument("dest_root", type=Path, help="folder holding manifest.sqlite and/or zip archives")
+    p_verify.add_argument("--sample", action="store_true", help="sample-hash only (fast spot check)")
+    p_verify.add_argument("--workers", type=int, default=VERIFY_WORKERS)
+    args = ap.parse_args()
+
+    if not args.dest_root.is_dir():
+        print(f"[ERROR] Not a folder: {args.dest_root}")
+        sys.exit(1)
+
+    results = []
+    manifest_db = args.dest_root / "manifest.sqlite"
+    if manifest_db.exists():
+        r = verify_manifest(args.dest_root, manifest_db, args.sample, args.workers)
+        print(f"[INFO] Files: {r.ok}/{r.checked} ok, {len(r.missing)} missing, {len(r.corrupt)} corrupt, "
+              f"{r.bytes_read / 1e9:.2f} GB read")
+        results.append(r)
+    r = verify_zips(args.dest_root, args.workers)
+    if r.checked:
+        print(f"[INFO] Zips: {r.ok}/{r.checked} ok, {len(r.corrupt)} corrupt")
+        results.append(r)
+    if not results:
+        print(f"[WARN] Nothing to verify in {args.dest_root}")
+    if any(r.missing or r.corrupt for r in results):
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SHARED SOURCE INVENTORY for the scheduled backup scripts.
+- One concurrent scan of the experiment_*/included/__YYYYMMDD_* hierarchy records
+  the listing (sub-folders with mtimes, files with size/mtime) of every folder
+  either job reads: experiments, subjects, camera folders, and the experiment and
+  subject sub-folders named in a ScanSpec.
+- An Inventory answers the same listing calls as backup_discovery.LIVE, so the
+  data and video jobs consume it unchanged. Folders the scan did not cover are
+  listed live, so a narrow spec costs speed, never correctness.
+- Saved as a gzipped JSON snapshot; a later job within the max age can reuse it
+  instead of walking the share again (see backup_runner.py).
+"""
+
+import os
+import re
+import json
+import gzip
+import stat
+import time
+import posixpath
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import backup_discovery as discovery
+from backup_metrics import PhaseStats
+
+INVENTORY_KEEP = 3   # saved inventories kept per cache folder
+
+# per folder: sub-folder name -> mtime, file name -> (size, mtime)
+Listing = Tuple[Dict[str, float], Dict[str, Tuple[int, float]]]
+
+
+@dataclass
+class ScanSpec:
+    """Which folders the scan lists recursively, besides experiments and subjects themselves."""
+    exp_folders: Tuple[str, ...] = ()        # below each experiment, by name
+    subject_folders: Tuple[str, ...] = ()    # below each subject, by name
+    subject_dir_regex: re.Pattern | None = discovery.CAM_DIR_REGEX   # below each subject, by pattern
+    exp_regex: re.Pattern = discovery.EXP_REGEX
+    subj_regex: re.Pattern = discovery.SUBJ_REGEX
+
+
+class InventoryEntry:
+    """Stand-in for os.DirEntry, built from a recorded listing."""
+    __slots__ = ("name", "path", "_size", "_mtime", "_is_dir")
+
+    def __init__(self, folder: str, name: str, size: int, mtime: float, is_dir: bool = False):
+        self.name = name
+        self.path = os.path.join(folder, name)
+        self._size, self._mtime, self._is_dir = size, mtime, is_dir
+
+    def is_dir(self) -> bool:
+        return self._is_dir
+
+    def is_file(self) -> bool:
+        return not self._is_dir
+
+    def stat(self) -> os.stat_result:
+        mode = stat.S_IFDIR if self._is_dir else stat.S_IFREG
+        return os.stat_result((mode, 0, 0, 1, 0, 0, self._size, self._mtime, self._mtime, self._mtime))
+
+
+def _list(path: Path) -> Listing:
+    dirs: Dict[str, float] = {}
+    files: Dict[str, Tuple[int, float]] = {}
+    with os.scandir(path) as it:
+        for e in it:
+            try:
+                if e.is_dir():
+                    dirs[e.name] = e.stat().st_mtime
+                elif e.is_file():
+                    st = e.stat()   # cached by scandir on Windows
+                    files[e.name] = (st.st_size, st.st_mtime)
+            except FileNotFoundError:
+                continue   # vanished mid-scan
+    return dirs, files
+
+
+class Inventory(discovery.LiveTree):
+    """Recorded listings below `root`, served through the LiveTree interface."""
+
+    def __init__(self, root: Path, listings: Dict[str, Listing], created: float | None = None):
+        self.root = Path(root)
+        self.listings = listings
+        self.created = time.time() if created is None else created
+        self.misses = 0   # listing calls that had to go to the file system
+        self._root = os.path.normpath(str(self.root))
+        self._lock = threading.Lock()
+
+    # ---- scan / persistence ----
+
+    @staticmethod
+    def scan(root: Path, spec: ScanSpec = ScanSpec(), workers: int = discovery.SCAN_WORKERS,
+             stats: PhaseStats | None = None) -> "Inventory":
+        """List root, its experiments and subjects, and the folders `spec` asks for."""
+        stats = stats or PhaseStats("unused")
+        stats.start()
+        listings: Dict[str, Listing] = {}
+        lock = threading.Lock()
+
+        def _record(path: Path) -> Listing:
+            listing = _list(path)
+            stats.add_stats(1 + len(listing[0]) + len(listing[1]))
+            for size in (size for size, _ in listing[1].values()):
+                stats.add_file(path, size)
+            with lock:
+                listings[Path(os.path.relpath(path, root)).as_posix()] = listing
+            return listing
+
+        def _walk(path: Path):
+            stack = [path]
+            while stack:
+                folder = stack.pop()
+                stack.extend(folder / name for name in _record(folder)[0])
+
+        def _scan_experiment(exp_dir: Path) -> List[Path]:
+            dirs, _ = _record(exp_dir)
+            for name in spec.exp_folders:
+                if name in dirs:
+                    _walk(exp_dir / name)
+            base = exp_dir
+            if "included" in dirs:
+                base = exp_dir / "included"
+                dirs, _ = _record(base)
+            return [base / name for name in dirs if spec.subj_regex.match(name)]
+
+        def _scan_subject(subj_dir: Path):
+            dirs, _ = _record(subj_dir)
+            for name in dirs:
+                if name in spec.subject_folders or (spec.subject_dir_regex and spec.subject_dir_regex.match(name)):
+                    _walk(subj_dir / name)
+
+        experiments = [root / name for name in _record(root)[0] if spec.exp_regex.match(name)]
+        subjects: List[Path] = []
+        for exp_dir, found, err in discovery.stream_map(_scan_experiment, experiments, workers):
+            if err is not None:
+                stats.add_error()   # left out: the jobs list it live and report the error themselves
+                continue
+            subjects.extend(found)
+        for _, _, err in discovery.stream_map(_scan_subject, subjects, workers):
+            if err is not None:
+                stats.add_error()
+        stats.stop()
+        return Inventory(root, listings)
+
+    def save(self, cache_dir: Path, keep: int = INVENTORY_KEEP) -> Path:
+        """Write inventory_<timestamp>.json.gz (atomically) and drop older ones beyond `keep`."""
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        path = cache_dir / f"inventory_{datetime.fromtimestamp(self.created):%Y%m%d_%H%M%S}.json.gz"
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump({'root': str(self.root), 'created': self.created,
+                       'dirs': {rel: [dirs, files] for rel, (dirs, files) in self.listings.items()}}, f)
+        os.replace(tmp, path)
+        for old in sorted(cache_dir.glob("inventory_*.json.gz"))[:-keep]:
+            old.unlink(missing_ok=True)
+        return path
+
+    @staticmethod
+    def load(path: Path) -> "Inventory":
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            doc = json.load(f)
+        listings = {rel: (dirs, {name: (size, mtime) for name, (size, mtime) in files.items()})
+                    for rel, (dirs, files) in doc['dirs'].items()}
+        return Inventory(Path(doc['root']), listings, doc['created'])
+
+    @staticmethod
+    def latest(cache_dir: Path, root: Path, max_age: float) -> "Inventory | None":
+        """The newest saved inventory of `root` that is younger than max_age seconds."""
+        for path in sorted(cache_dir.glob("inventory_*.json.gz"), reverse=True):
+            try:
+                inv = Inventory.load(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            if os.path.normpath(str(inv.root)) == os.path.normpath(str(root)):
+                return inv if time.time() - inv.created <= max_age else None
+        return None
+
+    def summary(self) -> str:
+        files = sum(len(f) for _, f in self.listings.values())
+        size = sum(s for _, f in self.listings.values() for s, _ in f.values())
+        return f"{len(self.listings)} folders, {files} files, {size / 1e9:.2f} GB"
+
+    # ---- lookups ----
+
+    def _rel(self, path: Path | str) -> str | None:
+        try:
+            rel = os.path.relpath(os.path.normpath(str(path)), self._root)
+        except ValueError:   # other drive
+            return None
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            return None
+        return Path(rel).as_posix()
+
+    def _parent(self, rel: str | None) -> Tuple[Listing | None, str]:
+        """Listing of rel's parent folder (None if not recorded) and rel's own name."""
+        if rel is None or rel == ".":
+            return None, ""
+        return self.listings.get(posixpath.dirname(rel) or "."), posixpath.basename(rel)
+
+    def _lookup(self, path: Path | str) -> Tuple[str | None, Listing | None]:
+        """(rel, listing) if path was listed; raise if the scan shows it does not exist;
+           (rel, None) if the scan did not cover it."""
+        rel = self._rel(path)
+        if rel is None:
+            return None, None
+        listing = self.listings.get(rel)
+        if listing is not None:
+            return rel, listing
+        parent, name = self._parent(rel)
+        if parent is not None and name not in parent[0]:
+            if name in parent[1]:
+                raise NotADirectoryError(str(path))
+            raise FileNotFoundError(str(path))
+        with self._lock:
+            self.misses += 1
+        return rel, None
+
+    def _parent_entry(self, path: Path | str) -> Tuple[bool, float, int] | None:
+        """(is_dir, mtime, size) from the parent's listing, None if not covered."""
+        rel = self._rel(path)
+        parent, name = self._parent(rel)
+        if parent is None:
+            return None
+        if name in parent[0]:
+            return True, parent[0][name], 0
+        if name in parent[1]:
+            size, mtime = parent[1][name]
+            return False, mtime, size
+        raise FileNotFoundError(str(path))
+
+    # ---- LiveTree interface ----
+
+    def list_dirs(self, path: Path, pattern: re.Pattern | None = None) -> List[Path]:
+        _, listing = self._lookup(path)
+        if listing is None:
+            return discovery.list_dirs(path, pattern)
+        return [Path(path) / name for name in listing[0] if pattern is None or pattern.match(name)]
+
+    def list_files(self, path: Path, match: discovery.Matcher | None = None) -> List[InventoryEntry]:
+        _, listing = self._lookup(path)
+        if listing is None:
+            return discovery.list_files(path, match)
+        return [InventoryEntry(str(path), name, size, mtime) for name, (size, mtime) in listing[1].items()
+                if match is None or match(name)]
+
+    def walk_files(self, root: Path, match: discovery.Matcher | None = None,
+                   subdirs: List[Path] | None = None) -> Iterator[InventoryEntry]:
+        stack = [str(root)]
+        while stack:
+            folder = stack.pop()
+            _, listing = self._lookup(folder)
+            if listing is None:
+                yield from discovery.walk_files(Path(folder), match, subdirs)
+                continue
+            for name in listing[0]:
+                stack.append(os.path.join(folder, name))
+                if subdirs is not None:
+                    subdirs.append(Path(folder) / name)
+            for name, (size, mtime) in listing[1].items():
+                if match is None or match(name):
+                    yield InventoryEntry(folder, name, size, mtime)
+
+    def stat(self, path: Path) -> os.stat_result:
+        hit = self._parent_entry(path)
+        if hit is None:
+            return os.stat(path)
+        is_dir, mtime, size = hit
+        return InventoryEntry(os.path.dirname(str(path)), os.path.basename(str(path)), size, mtime, is_dir).stat()
+
+    def is_dir(self, path: Path) -> bool:
+        try:
+            hit = self._parent_entry(path)
+        except FileNotFoundError:
+            return False
+        return os.path.isdir(path) if hit is None else hit[0]
+
+    def is_file(self, path: Path) -> bool:
+        try:
+            hit = self._parent_entry(path)
+        except FileNotFoundError:
+            return False
+        return os.path.isfile(path) if hit is None else not hit[0]
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RUN LOGGING shared by the scheduled backup scripts.
+- Everything goes through the "backup" logger. RunLog puts a QueueHandler on it,
+  and a background QueueListener does the writes, so worker threads never block
+  on disk.
+- Writes go to a LOCAL folder (LOG_DIR): <job>_<ts>.log for the human-readable
+  log and <job>_<ts>.files.jsonl with one compact record per file. At close()
+  both are copied to the destination share in one go.
+- At INFO, per-file lines are replaced by per-directory summaries (DirTally).
+  Per-file lines reach the text log only when verbose; the JSONL always has them.
+"""
+
+import sys
+import json
+import atexit
+import queue
+import shutil
+import logging
+import threading
+import logging.handlers
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+LOG_DIR = Path(__file__).resolve().parent / "logs"   # local disk, not the share
+LOGGER_NAME = "backup"
+
+logging.addLevelName(logging.WARNING, "WARN")
+_CONSOLE_FMT = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+
+
+class _Stdout(logging.StreamHandler):
+    """Console handler that follows sys.stdout, so redirect_stdout still applies."""
+
+    def __init__(self, level: int):
+        super().__init__()
+        self.setLevel(level)
+        self.setFormatter(_CONSOLE_FMT)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, _value):
+        pass
+
+
+def get_logger(verbose: bool = False) -> logging.Logger:
+    """The shared logger. Without an active RunLog it gets a plain console handler."""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(_Stdout(logging.DEBUG if verbose else logging.INFO))
+    return logger
+
+
+def file_event(logger: logging.Logger, op: str, src: Path | str, dst: Path | str | None = None,
+               size: int | None = None, seconds: float | None = None, error: str | None = None):
+    """One per-file record: a JSONL line always, a DEBUG text line for verbose logs."""
+    event = {'op': op, 'src': str(src)}
+    if dst is not None:
+        event['dst'] = str(dst)
+    if size is not None:
+        event['size'] = size
+    if seconds is not None:
+        event['s'] = round(seconds, 4)
+    if error is not None:
+        event['error'] = error
+    text = f"{op.upper()}: {src}" + (f"  -->  {dst}" if dst is not None else "") + (f" ({error})" if error else "")
+    logger.log(logging.WARNING if error else logging.DEBUG, text, extra={'event': event})
+
+
+class DirTally:
+    """Per-directory outcome counts, emitted as one INFO line per directory."""
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def add(self, key: str, outcome: str, nbytes: int = 0):
+        with self._lock:
+            c = self._counts[key]
+            c[outcome] += 1
+            c['bytes'] += nbytes
+
+    def emit(self, logger: logging.Logger, key: str | None = None):
+        """Log and forget one directory's summary, or all remaining ones if key is None."""
+        with self._lock:
+            keys: List[str] = sorted(self._counts) if key is None else [key] if key in self._counts else []
+            items = [(k, self._counts.pop(k)) for k in keys]
+        for k, c in items:
+            parts = [f"{n} {outcome}" for outcome, n in sorted(c.items()) if outcome != 'bytes']
+            logger.info(f"{k}: {', '.join(parts)} ({c['bytes'] / 1e6:.1f} MB)")
+
+
+class _JsonlFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(dict(record.event, t=round(record.created, 3)))
+
+
+class RunLog:
+    """Queue-backed logging for one run. Use close() (or `with`) to flush and publish."""
+
+    def __init__(self, job: str, verbose: bool = False, log_dir: Path = LOG_DIR, console: bool = True):
+        log_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{job}_{datetime.now():%Y%m%d_%H%M%S}"
+        self.text_path = log_dir / f"{stem}.log"
+        self.events_path = log_dir / f"{stem}.files.jsonl"
+
+        text = logging.FileHandler(self.text_path, encoding="utf-8")
+        text.setLevel(logging.DEBUG if verbose else logging.INFO)
+        text.setFormatter(_CONSOLE_FMT)
+        events = logging.FileHandler(self.events_path, encoding="utf-8")
+        events.setLevel(logging.DEBUG)
+        events.setFormatter(_JsonlFormatter())
+        events.addFilter(lambda record: hasattr(record, 'event'))
+        handlers: List[logging.Handler] = [text, events]
+        if console:
+            handlers.append(_Stdout(logging.DEBUG if verbose else logging.INFO))
+        # per-file events are DEBUG (failures WARN), so INFO handlers keep only summaries and problems
+        self._handlers = handlers
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(self._queue, *handlers, respect_handler_level=True)
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self._previous = list(self.logger.handlers)
+        self.logger.handlers = [logging.handlers.QueueHandler(self._queue)]
+        self._listener.start()
+        self._closed = False
+        atexit.register(self.close)  # a crashed run still gets its local log flushed
+
+    def close(self, publish_to: Path | None = None) -> List[Path]:
+        """Drain the queue, close the files and copy them into publish_to (if given)."""
+        if self._closed:
+            return []
+        self._closed = True
+        atexit.unregister(self.close)
+        self._listener.stop()
+        for h in self._handlers:
+            h.close()
+        self.logger.handlers = self._previous
+        published = []
+        if publish_to is not None:
+            try:
+                publish_to.mkdir(parents=True, exist_ok=True)
+                for p in (self.text_path, self.events_path):
+                    published.append(Path(shutil.copy2(p, publish_to / p.name)))
+            except OSError as e:
+                self.logger.warning(f"Could not copy logs to {publish_to}: {e}")
+        return published
+
+    def __enter__(self) -> "RunLog":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
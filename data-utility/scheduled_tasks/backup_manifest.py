@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PERSISTENT BACKUP MANIFEST shared by the scheduled backup scripts.
+- SQLite table of rel_path -> (size, mtime) for every file already backed up,
+  plus the content hashes and backup location when the writer recorded them.
+- Indexed lookups and batched upserts, so cost scales with changed files,
+  not with the lifetime size of the archive.
+- One-shot migration from the old manifest.csv format.
+"""
+
+import csv
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Iterable
+
+MANIFEST_BATCH = 500   # manifest upserts per SQLite transaction
+
+
+class Manifest:
+    """Persistent rel_path -> (size, mtime) index stored in SQLite.
+
+    Lookups hit the primary-key index, so start-up and shutdown no longer
+    scale with the size of the whole archive. Upserts are committed in
+    batches of `batch_size`; call save() to flush the rest. The public
+    methods are serialised by a lock and may be called from worker threads.
+    """
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS manifest ("
+        "rel_path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL)",
+        # directory fingerprints for DirCache; mtime NULL = never prune
+        "CREATE TABLE IF NOT EXISTS dirs ("
+        "rel_dir TEXT PRIMARY KEY, parent TEXT NOT NULL, mtime REAL, "
+        "entries INTEGER NOT NULL, total_size INTEGER NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    ]
+    # columns added after the first release: full / sample SHA-256 (see backup_integrity)
+    # and where the copy lives, relative to the destination root
+    EXTRA_COLUMNS = {"hash": "TEXT", "sample": "TEXT", "location": "TEXT"}
+
+    def __init__(self, conn: sqlite3.Connection, batch_size: int = MANIFEST_BATCH):
+        self.conn = conn
+        self.batch_size = batch_size
+        self._pending = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def open(db_path: Path, legacy_csv: Path | None = None, read_only: bool = False) -> "Manifest":
+        """Open (or create) the manifest DB, migrating a legacy manifest.csv once.
+
+        With read_only=True nothing is written to disk: the run works on an
+        in-memory snapshot of the DB (or of the CSV if there is no DB yet).
+        """
+        if read_only:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            if db_path.exists():
+                src = sqlite3.connect(f"{db_path.as_uri()}?mode=ro", uri=True)
+                src.backup(conn)
+                src.close()
+        else:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in Manifest.SCHEMA:
+            conn.execute(stmt)
+        have = {row[1] for row in conn.execute("PRAGMA table_info(manifest)")}
+        for name, decl in Manifest.EXTRA_COLUMNS.items():
+            if name not in have:
+                conn.execute(f"ALTER TABLE manifest ADD COLUMN {name} {decl}")
+        m = Manifest(conn)
+        if legacy_csv is not None and legacy_csv.exists() and m.count() == 0:
+            n = m._migrate_csv(legacy_csv)
+            logging.getLogger("backup").info(f"Migrated {n} rows from {legacy_csv.name}")
+            if not read_only:
+                legacy_csv.rename(legacy_csv.with_name(legacy_csv.name + ".migrated"))
+        return m
+
+    def _migrate_csv(self, csv_path: Path) -> int:
+        def rows():
+            with csv_path.open('r', newline='', encoding='utf-8') as f:
+                # expects: rel_path,size,mtime
+                for row in csv.DictReader(f):
+                    rel = row.get('rel_path', '')
+                    if not rel:
+                        continue
+                    try:
+                        yield rel, int(float(row.get('size', '0'))), float(row.get('mtime', '0'))
+                    except Exception:
+                        continue
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO manifest (rel_path, size, mtime) VALUES (?, ?, ?)", rows())
+        return self.count()
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM manifest").fetchone()[0]
+
+    def size_under(self, prefix: str) -> int:
+        """Total recorded size of the rows below a folder prefix such as 'experiment_12/__20160225_17406/'."""
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)   # range scan on the primary key
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM manifest WHERE rel_path >= ? AND rel_path < ?",
+                                     (prefix, upper)).fetchone()[0]
+
+    def known(self, rel_path: str) -> bool:
+        """True if rel_path was backed up before (in any version)."""
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM manifest WHERE rel_path = ?", (rel_path,)).fetchone() is not None
+
+    def needs_copy(self, rel_path: str, size: int, mtime: float,
+                   sampler: Callable[[], str] | None = None, recheck: bool = False) -> bool:
+        """Return True if file is NEW or CHANGED vs manifest.
+
+        A different size is always a change. Same size and mtime is unchanged,
+        unless `recheck` is set. Otherwise, if a sample hash was recorded and
+        a `sampler` is given, the sample decides, so a touched-but-identical
+        file is not recopied and a same-mtime edit is still caught. Without
+        one, any mtime difference counts, including an older mtime (a
+        restored file).
+        """
+        with self._lock:
+            hit = self.conn.execute(
+                "SELECT size, mtime, sample FROM manifest WHERE rel_path = ?", (rel_path,)).fetchone()
+        if hit is None:
+            return True
+        old_size, old_mtime, old_sample = hit
+        if old_size != size:
+            return True
+        if old_mtime == mtime and not recheck:
+            return False
+        if sampler is None or old_sample is None:
+            return old_mtime != mtime
+        if sampler() != old_sample:
+            return True
+        if old_mtime != mtime:
+            # same content: take the new mtime so the next run uses the fast path again
+            with self._lock:
+                self.conn.execute("UPDATE manifest SET mtime = ? WHERE rel_path = ?", (mtime, rel_path))
+        return False
+
+    def sample_wanted(self, rel_path: str, size: int, mtime: float, recheck: bool = False) -> bool:
+        """True if needs_copy would consult a sampler for this file, so the sample hash can
+           be computed ahead (e.g. on a scan worker) instead of on the consuming thread."""
+        with self._lock:
+            hit = self.conn.execute(
+                "SELECT size, mtime, sample FROM manifest WHERE rel_path = ?", (rel_path,)).fetchone()
+        return (hit is not None and hit[2] is not None and hit[0] == size
+                and (hit[1] != mtime or recheck))
+
+    def upsert(self, rel_path: str, size: int, mtime: float, digest: str | None = None,
+               sample: str | None = None, location: str | None = None):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO manifest (rel_path, size, mtime, hash, sample, location) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(rel_path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, "
+                "hash = excluded.hash, sample = excluded.sample, location = excluded.location",
+                (rel_path, size, mtime, digest, sample, location))
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self.save()
+
+    def delete(self, rel_paths: Iterable[str]):
+        with self._lock:
+            self.conn.executemany("DELETE FROM manifest WHERE rel_path = ?", ((rel,) for rel in rel_paths))
+
+    def get_meta(self, key: str) -> str | None:
+        with self._lock:
+            hit = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return hit[0] if hit else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def save(self):
+        """Commit outstanding upserts."""
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RUN METRICS for the scheduled backup scripts.
+- A RunMetrics per run holds one PhaseStats per phase (scan, copy, zip, ...):
+  wall time, files, bytes, MB/s, stat calls, errors and the slowest files.
+- PhaseStats are passed explicitly into the functions doing the work and are
+  safe to update from worker threads; phases may overlap (the video scan
+  streams into the copy pool).
+- At the end of a run, write() saves a JSON report and appends a one-line
+  summary to history.jsonl in the same folder, for spotting regressions.
+"""
+
+import os
+import json
+import time
+import heapq
+import socket
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SLOWEST_FILES = 10   # per phase, kept in the JSON report
+
+
+@dataclass
+class PhaseStats:
+    name: str
+    seconds: float = 0.0
+    files: int = 0
+    bytes: int = 0
+    stat_calls: int = 0
+    errors: int = 0
+    slowest: List[Tuple[float, str, int]] = field(default_factory=list)  # min-heap of (seconds, path, bytes)
+    _t0: float | None = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def start(self):
+        self._t0 = time.monotonic()
+
+    def stop(self):
+        if self._t0 is not None:
+            self.seconds += time.monotonic() - self._t0
+            self._t0 = None
+
+    def __enter__(self) -> "PhaseStats":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def add_file(self, path: str | Path, nbytes: int, seconds: float | None = None):
+        with self._lock:
+            self.files += 1
+            self.bytes += nbytes
+        if seconds is not None:
+            self.add_time(path, nbytes, seconds)
+
+    def add_time(self, path: str | Path, nbytes: int, seconds: float):
+        """Per-file time for the slowest-files list, for files counted elsewhere."""
+        item = (seconds, str(path), nbytes)
+        with self._lock:
+            if len(self.slowest) < SLOWEST_FILES:
+                heapq.heappush(self.slowest, item)
+            elif item > self.slowest[0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def add_stats(self, n: int = 1):
+        with self._lock:
+            self.stat_calls += n
+
+    def add_error(self, n: int = 1):
+        with self._lock:
+            self.errors += n
+
+    @property
+    def mb_per_sec(self) -> float:
+        return (self.bytes / 1e6) / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'seconds': round(self.seconds, 3),
+            'files': self.files,
+            'bytes': self.bytes,
+            'mb_per_sec': round(self.mb_per_sec, 2),
+            'stat_calls': self.stat_calls,
+            'errors': self.errors,
+            'slowest': [{'path': p, 'seconds': round(s, 3), 'bytes': b}
+                        for s, p, b in sorted(self.slowest, reverse=True)],
+        }
+
+
+class RunMetrics:
+    """All phases of one backup run, plus free-form `info` for the report."""
+
+    def __init__(self, job: str):
+        self.job = job
+        self.started = datetime.now()
+        self._t0 = time.monotonic()
+        self.phases: Dict[str, PhaseStats] = {}
+        self.info: Dict[str, object] = {}
+
+    def phase(self, name: str) -> PhaseStats:
+        if name not in self.phases:
+            self.phases[name] = PhaseStats(name)
+        return self.phases[name]
+
+    def report(self) -> dict:
+        return {
+            'job': self.job,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'started': self.started.isoformat(timespec='seconds'),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'seconds': round(time.monotonic() - self._t0, 3),
+            'errors': sum(p.errors for p in self.phases.values()),
+            'phases': {name: p.to_dict() for name, p in self.phases.items()},
+            'info': self.info,
+        }
+
+    def summary(self) -> str:
+        return "; ".join(f"{name} {p.seconds:.1f}s {p.files} files {p.mb_per_sec:.1f} MB/s"
+                         + (f" {p.errors} errors" if p.errors else "")
+                         for name, p in self.phases.items())
+
+    def write(self, report_dir: Path) -> Path:
+        """Write run_<job>_<timestamp>.json and append a summary line to history.jsonl."""
+        report = self.report()
+        report_dir.mkdir(parents=True, exist_ok=True)
+        path = report_dir / f"run_{self.job}_{self.started:%Y%m%d_%H%M%S}.json"
+        with path.open('w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        line = {k: report[k] for k in ('job', 'started', 'seconds', 'errors')}
+        line['phases'] = {name: {k: v for k, v in p.items() if k != 'slowest'}
+                          for name, p in report['phases'].items()}
+        with (report_dir / "history.jsonl").open('a', encoding='utf-8') as f:
+            f.write(json.dumps(line) + "\n")
+        return path
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+NIGHTLY JOB RUNNER: one scan of the multiwork share feeding both backup jobs.
+- Scans MULTIWORK_ROOT once (backup_inventory) for what the jobs share: experiments
+  and their EXPERIMENT_SUBFOLDERS, subjects and SUBJECT_FOLDERS. backup_exp_data and
+  backup_exp_video then run on that inventory instead of each walking the share.
+- Camera folders are left out: the video job prunes unchanged ones by their directory
+  fingerprint (the cam mtimes come from the subject listings) and lists only the
+  changed ones, live.
+- The inventory is saved to INVENTORY_DIR; a run within INVENTORY_MAX_AGE (e.g. a
+  re-run after a failure, or a later job) reuses it instead of scanning again.
+- Jobs run one after the other; a failing job does not stop the next one.
+    python backup_runner.py [--jobs data video] [--rescan] [--max-age-hours 6]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import backup_exp_data as data
+import backup_exp_video as video
+from backup_inventory import Inventory, ScanSpec
+from backup_logging import get_logger
+from backup_metrics import PhaseStats
+
+INVENTORY_DIR     = Path(__file__).resolve().parent / "inventory"   # local disk, next to logs/
+INVENTORY_MAX_AGE = 6 * 3600   # seconds a saved inventory may be reused
+
+JOBS = {'data': data.main, 'video': video.main}
+
+logger = get_logger()
+
+
+def scan_spec() -> ScanSpec:
+    """What both jobs list below experiments and subjects; camera folders are left to the
+       video job, which skips most of them (see DirCache)."""
+    return ScanSpec(exp_folders=tuple(data.EXPERIMENT_SUBFOLDERS),
+                    subject_folders=tuple(data.SUBJECT_FOLDERS),
+                    subject_dir_regex=None,
+                    exp_regex=video.EXP_REGEX,
+                    subj_regex=video.SUBJ_REGEX)
+
+
+def load_or_scan(root: Path, max_age: float = INVENTORY_MAX_AGE, rescan: bool = False,
+                 cache_dir: Path = INVENTORY_DIR) -> Inventory:
+    inv = None if rescan else Inventory.latest(cache_dir, root, max_age)
+    if inv is not None:
+        logger.info(f"Reusing saved inventory of {root}: {inv.summary()}")
+        return inv
+    stats = PhaseStats("inventory")
+    inv = Inventory.scan(root, scan_spec(), stats=stats)
+    logger.info(f"Scanned {root} in {stats.seconds:.1f}s: {inv.summary()}, {stats.stat_calls} stat calls"
+                + (f", {stats.errors} folders failed" if stats.errors else ""))
+    try:
+        logger.info(f"Inventory saved: {inv.save(cache_dir)}")
+    except OSError as e:
+        logger.warning(f"Could not save inventory: {e}")
+    return inv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the nightly backup jobs from one shared scan.")
+    ap.add_argument("--jobs", nargs="+", choices=list(JOBS), default=list(JOBS))
+    ap.add_argument("--rescan", action="store_true", help="ignore a saved inventory")
+    ap.add_argument("--max-age-hours", type=float, default=INVENTORY_MAX_AGE / 3600)
+    args = ap.parse_args()
+
+    root = video.MULTIWORK_ROOT
+    if not root.is_dir():
+        logger.error(f"Multiwork root not found: {root}")
+        sys.exit(1)
+    inv = load_or_scan(root, args.max_age_hours * 3600, args.rescan, INVENTORY_DIR)
+
+    failed = []
+    for name in args.jobs:
+        logger.info(f"Running {name} job")
+        try:
+            JOBS[name](tree=inv)
+        except Exception as e:
+            logger.exception(f"{name} job failed: {e}")
+            failed.append(name)
+    logger.info(f"Done; {inv.misses} listings outside the inventory"
+                + (f"; failed jobs: {', '.join(failed)}" if failed else ""))
+    if failed:
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+CONTENT-ADDRESSED BACKUP STORE shared by the scheduled backup scripts.
+- Every file is stored once, as blobs/<xx>/<sha256>, no matter how many runs,
+  subjects or file names refer to it.
+- A SQLite index (store_index.sqlite) knows every blob, plus a hash cache keyed
+  by (rel_path, size, mtime) so unchanged sources are not re-read.
+- Each run writes a small gzipped JSON snapshot (snapshots/<name>.json.gz) listing
+  rel_path -> hash. Snapshots may name a parent, for jobs that only record changes.
+- Restore any snapshot (or a sub-tree of it) with:
+    python backup_store.py list    <store_root>
+    python backup_store.py restore <store_root> <snapshot> <target_dir> [--prefix experiment_12/__20160225_17406] [--link]
+  --link hardlinks blobs into the target when it is on the store's volume (instant,
+  no extra space); the restored files then must not be edited in place.
+"""
+
+import os
+import sys
+import gzip
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from backup_copy import CopyBackend
+
+HASH_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+class BlobStore:
+    """Blob directory plus its hash index. Safe to use from worker threads."""
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, size INTEGER NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS blobs_size ON blobs (size)",
+        "CREATE TABLE IF NOT EXISTS hash_cache ("
+        "rel_path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, hash TEXT NOT NULL)",
+    ]
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.snapshot_dir = self.root / "snapshots"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.root / "store_index.sqlite", check_same_thread=False)
+        for stmt in self.SCHEMA:
+            self.conn.execute(stmt)
+        self._lock = threading.RLock()
+        self.bytes_written = 0
+        self.bytes_deduped = 0
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    # ---- index ----
+
+    def _cached_hash(self, rel_path: str, size: int, mtime: float) -> str | None:
+        with self._lock:
+            hit = self.conn.execute("SELECT size, mtime, hash FROM hash_cache WHERE rel_path = ?",
+                                    (rel_path,)).fetchone()
+        if hit and hit[0] == size and hit[1] == mtime:
+            return hit[2]
+        return None
+
+    def _has_blob(self, digest: str) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is not None
+
+    def _has_size(self, size: int) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM blobs WHERE size = ? LIMIT 1", (size,)).fetchone() is not None
+
+    def _record(self, rel_path: str, size: int, mtime: float, digest: str, new_blob: bool):
+        with self._lock:
+            if new_blob:
+                self.conn.execute("INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)", (digest, size))
+                self.bytes_written += size
+            else:
+                self.bytes_deduped += size
+            self.conn.execute("INSERT OR REPLACE INTO hash_cache (rel_path, size, mtime, hash) VALUES (?, ?, ?, ?)",
+                              (rel_path, size, mtime, digest))
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    # ---- writing ----
+
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        h = hashlib.sha256()
+        buf = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buf)
+        with path.open('rb') as f:
+            while n := f.readinto(buf):
+                h.update(view[:n])
+        return h.hexdigest()
+
+    def _copy_hashing(self, src: Path) -> Tuple[str, Path]:
+        """Single read of src: copy to a temp file in the store while hashing."""
+        tmp = self.blob_dir / f".incoming_{threading.get_ident()}_{os.getpid()}"
+        h = hashlib.sha256()
+        buf = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buf)
+        with src.open('rb') as fsrc, tmp.open('wb') as fdst:
+            while n := fsrc.readinto(buf):
+                h.update(view[:n])
+                fdst.write(view[:n])
+        return h.hexdigest(), tmp
+
+    def _install(self, tmp: Path, digest: str) -> bool:
+        """Move a temp file into place as blob `digest`; False if it already existed."""
+        dst = self.blob_path(digest)
+        dst.parent.mkdir(exist_ok=True)
+        if dst.exists():
+            tmp.unlink()
+            return False
+        os.replace(tmp, dst)
+        return True
+
+    def put_file(self, src: Path, rel_path: str) -> Tuple[str, int, float]:
+        """Store src's content (if unseen) and return (hash, size, mtime).
+
+        An unchanged (rel_path, size, mtime) reuses the cached hash without
+        reading the file. Otherwise, if no known blob has the same size the
+        content cannot be a duplicate, so it is copied and hashed in one pass;
+        if one does, it is hashed first and only copied when unseen.
+        """
+        st = src.stat()
+        size, mtime = st.st_size, st.st_mtime
+        digest = self._cached_hash(rel_path, size, mtime)
+        if digest is not None and self._has_blob(digest):
+            self._record(rel_path, size, mtime, digest, new_blob=False)
+            return digest, size, mtime
+
+        if self._has_size(size):
+            digest = self.hash_file(src)
+            if self._has_blob(digest):
+                self._record(rel_path, size, mtime, digest, new_blob=False)
+                return digest, size, mtime
+        digest, tmp = self._copy_hashing(src)
+        new_blob = self._install(tmp, digest)
+        self._record(rel_path, size, mtime, digest, new_blob=new_blob)
+        return digest, size, mtime
+
+    # ---- snapshots ----
+
+    def write_snapshot(self, name: str, entries: Dict[str, Tuple[str, int, float]], parent: str | None = None) -> Path:
+        """Write snapshots/<name>.json.gz. entries: rel_path -> (hash, size, mtime)."""
+        self.commit()  # never reference blobs the index has not durably recorded
+        doc = {
+            'name': name,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'parent': parent,
+            'entries': [{'path': p, 'hash': h, 'size': s, 'mtime': m} for p, (h, s, m) in sorted(entries.items())],
+        }
+        path = self.snapshot_dir / f"{name}.json.gz"
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(doc, f)
+        os.replace(tmp, path)
+        return path
+
+    def list_snapshots(self) -> List[str]:
+        return sorted(p.name[:-len(".json.gz")] for p in self.snapshot_dir.glob("*.json.gz"))
+
+    def read_snapshot(self, name: str) -> dict:
+        """One snapshot document as written, without resolving its parents."""
+        with gzip.open(self.snapshot_dir / f"{name}.json.gz", 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load_snapshot(self, name: str) -> Dict[str, Tuple[str, int, float]]:
+        """Resolve a snapshot (following parents) to rel_path -> (hash, size, mtime)."""
+        chain = []
+        while name:
+            doc = self.read_snapshot(name)
+            chain.append(doc)
+            name = doc.get('parent')
+        out: Dict[str, Tuple[str, int, float]] = {}
+        for doc in reversed(chain):
+            for e in doc['entries']:
+                out[e['path']] = (e['hash'], e['size'], e['mtime'])
+        return out
+
+    def latest_snapshot(self, prefix: str = "") -> str | None:
+        names = [n for n in self.list_snapshots() if n.startswith(prefix)]
+        return names[-1] if names else None
+
+    def restore(self, snapshot: str, target: Path, prefix: str = "", link: bool = False,
+                copier: CopyBackend | None = None) -> int:
+        """Reconstitute a snapshot (optionally only paths under prefix) below target.
+           With link=True blobs are hardlinked where possible; linked files share the
+           blob's inode, so their mtime is left alone."""
+        copier = copier or CopyBackend()
+        n = 0
+        for rel_path, (digest, _, mtime) in self.load_snapshot(snapshot).items():
+            if prefix and not (rel_path == prefix or rel_path.startswith(prefix.rstrip('/') + '/')):
+                continue
+            dst = target / rel_path
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if link:
+                dst.unlink(missing_ok=True)
+                if copier.link(self.blob_path(digest), dst) == "hardlink":
+                    n += 1
+                    continue
+            else:
+                copier.copy(self.blob_path(digest), dst)
+            os.utime(dst, (mtime, mtime))
+            n += 1
+        return n
+
+
+class SnapshotWriter:
+    """
+    Drop-in for backup_exp_data.ArchiveWriter that writes into a BlobStore.
+
+    put() stores the file's content (only if unseen) and records it under its
+    path relative to `root`; close() writes the snapshot manifest. Without a
+    parent the snapshot lists every file, so it restores on its own; jobs that
+    only put changed files pass the previous snapshot as parent.
+    """
+
+    def __init__(self, store: BlobStore, name: str, root: Path, parent: str | None = None):
+        self.store = store
+        self.name = name
+        self.root = root
+        self.parent = parent
+        self.final_path = store.snapshot_dir / f"{name}.json.gz"
+        self.count = 0
+        self.failed: List[Path] = []   # kept for ArchiveWriter compatibility; put() raises instead
+        self.entries: Dict[str, Tuple[str, int, float]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, src: Path, dst: Path, size: int | None = None) -> Tuple[str, int, float]:
+        rel = dst.relative_to(self.root).as_posix()  # size: ArchiveWriter signature, put_file stats anyway
+        entry = self.store.put_file(src, rel)
+        with self._lock:
+            if rel not in self.entries:
+                self.count += 1
+            self.entries[rel] = entry
+        return entry
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for _, size, _ in self.entries.values())
+
+    def close(self) -> List[Path]:
+        return [self.store.write_snapshot(self.name, self.entries, parent=self.parent)]
+
+    def abort(self):
+        self.store.commit()  # blobs already written stay valid for later runs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect or restore snapshots from a backup blob store.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_list = sub.add_parser("list", help="list snapshots")
+    p_list.add_argument("store_root", type=Path)
+    p_restore = sub.add_parser("restore", help="restore a snapshot into a folder")
+    p_restore.add_argument("store_root", type=Path)
+    p_restore.add_argument("snapshot", help="snapshot name, or 'latest'")
+    p_restore.add_argument("target", type=Path)
+    p_restore.add_argument("--prefix", default="", help="only restore paths under this rel_path prefix")
+    p_restore.add_argument("--job", default="", help="with 'latest': snapshot name prefix, e.g. data_ or video_")
+    p_restore.add_argument("--link", action="store_true",
+                           help="hardlink blobs instead of copying (same volume; do not edit restored files)")
+    args = ap.parse_args()
+
+    if not (args.store_root / "store_index.sqlite").exists():
+        print(f"[ERROR] Not a backup store: {args.store_root}")
+        sys.exit(1)
+    store = BlobStore(args.store_root)
+    if args.cmd == "list":
+        for name in store.list_snapshots():
+            print(name)
+    else:
+        name = store.latest_snapshot(args.job) if args.snapshot == "latest" else args.snapshot
+        if name is None:
+            print("[ERROR] Store has no snapshots")
+            sys.exit(1)
+        copier = CopyBackend()
+        n = store.restore(name, args.target, args.prefix, args.link, copier)
+        print(f"[INFO] Restored {n} files from {name} into {args.target} ({copier.summary()})")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+BENCHMARK HARNESS for the scheduled backup scripts, without the real M: drive.
+- Generates a synthetic multiwork tree with the real layout:
+    experiment_NN/{stimuli_images,survey_data,MCDI}/...
+    experiment_NN/included/__YYYYMMDD_NNNNN/{camNN_video_r,derived,reliability,
+        speech_transcription_p,supporting_files,extra_p}/...
+  Content is pseudo-random from a seed, so every run sees the same bytes.
+- Optionally adds artificial latency to metadata calls (os.scandir, os.stat,
+  os.listdir) under the source root, to mimic the network share.
+- Times the phases the nightly jobs spend their time in, each --repeat times:
+    scan      video discovery with an empty manifest (every file is new)
+    plan      incremental re-plan against the manifest left by `copy`
+              (with directory-fingerprint pruning, then with a full rescan)
+    copy      video copy of the full plan into a fresh batch folder
+    zip       data backup of the same tree straight into zip archive(s)
+
+    python bench_backup.py generate <root> [--scale small|medium|large]
+    python bench_backup.py run [--root <existing tree>] [--scale small] [--latency-ms 2]
+                               [--repeat 3] [--phases scan,plan,copy,zip] [--json out.json]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import contextlib
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import backup_exp_video as video
+import backup_exp_data as data
+from backup_manifest import Manifest
+
+PHASES = ["scan", "plan", "copy", "zip"]
+
+
+@dataclass
+class TreeSpec:
+    experiments: int = 2
+    subjects: int = 4          # per experiment
+    cams: int = 2              # per subject
+    videos: int = 2            # per camera folder
+    video_kb: int = 1024
+    data_files: int = 6        # per data folder (derived, reliability, ...)
+    data_kb: int = 16
+    seed: int = 1
+
+
+SCALES = {
+    "small":  TreeSpec(),
+    "medium": TreeSpec(experiments=4, subjects=12, cams=4, videos=3, video_kb=4096, data_files=20),
+    "large":  TreeSpec(experiments=8, subjects=30, cams=6, videos=4, video_kb=16384, data_files=50),
+}
+
+
+# ---------------------------------------------------------------------
+# Tree generator
+# ---------------------------------------------------------------------
+
+def generate_tree(root: Path, spec: TreeSpec) -> Dict[str, int]:
+    """Write a synthetic multiwork tree below root; returns file/byte counts."""
+    rng = random.Random(spec.seed)
+    counts = {'files': 0, 'bytes': 0}
+
+    def _write(path: Path, kb: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        nbytes = max(1, int(kb * 1024 * rng.uniform(0.75, 1.25)))
+        path.write_bytes(rng.randbytes(nbytes))
+        counts['files'] += 1
+        counts['bytes'] += nbytes
+
+    root.mkdir(parents=True, exist_ok=True)
+    _write(root / "multiwork_readme.txt", 1)
+    _write(root / "experiment_list.csv", 1)
+    for e in range(1, spec.experiments + 1):
+        exp = root / f"experiment_{e:02d}"
+        _write(exp / "notes.txt", 1)
+        _write(exp / "subject_table.xlsx", spec.data_kb)
+        _write(exp / "scratch.tmp", 1)   # not matched by the data backup
+        for k in range(spec.data_files):
+            _write(exp / "stimuli_images" / f"stim_{k:03d}.png", spec.data_kb)
+            _write(exp / "survey_data" / f"survey_{k:03d}.csv", 1)
+        _write(exp / "MCDI" / "mcdi_scores.xlsx", spec.data_kb)
+        for s in range(spec.subjects):
+            name = f"__2016{(s % 12) + 1:02d}{(s % 28) + 1:02d}_{17400 + e * 100 + s}"
+            subj = exp / "included" / name
+            _write(subj / f"{name}_info.mat", 2)
+            _write(subj / f"{name}_info.txt", 1)
+            for c in range(1, spec.cams + 1):
+                for v in range(spec.videos):
+                    _write(subj / f"cam{c:02d}_video_r" / f"{name}_cam{c:02d}_{v}.mp4", spec.video_kb)
+            for k in range(spec.data_files):
+                _write(subj / "derived" / f"cevent_{k:03d}.mat", spec.data_kb)
+                _write(subj / "reliability" / f"rel_{k:03d}.csv", 1)
+                _write(subj / "speech_transcription_p" / f"speech_{k:03d}.txt", 1)
+                _write(subj / "extra_p" / f"frame_{k:03d}_boxes.mat", spec.data_kb)
+                _write(subj / "extra_p" / f"frame_{k:03d}_boxes_face.mat", spec.data_kb)
+                _write(subj / "extra_p" / f"frame_{k:03d}_other.mat", spec.data_kb)
+            _write(subj / "supporting_files" / "session_notes.txt", 1)
+    return counts
+
+
+# ---------------------------------------------------------------------
+# Artificial latency
+# ---------------------------------------------------------------------
+
+@contextlib.contextmanager
+def latency(root: Path, seconds: float):
+    """Delay os.scandir / os.stat / os.listdir on paths under root by `seconds` each."""
+    if seconds <= 0:
+        yield
+        return
+    prefix = os.fspath(root)
+    originals = {name: getattr(os, name) for name in ("scandir", "stat", "listdir")}
+
+    def _wrap(fn: Callable):
+        def _slow(path=".", *args, **kwargs):
+            if isinstance(path, (str, os.PathLike)) and os.fspath(path).startswith(prefix):
+                time.sleep(seconds)
+            return fn(path, *args, **kwargs)
+        return _slow
+
+    for name, fn in originals.items():
+        setattr(os, name, _wrap(fn))
+    try:
+        yield
+    finally:
+        for name, fn in originals.items():
+            setattr(os, name, fn)
+
+
+# ---------------------------------------------------------------------
+# Phases
+# ---------------------------------------------------------------------
+
+@dataclass
+class PhaseResult:
+    phase: str
+    runs: List[float]
+    files: int
+    bytes: int
+
+    @property
+    def best(self) -> float:
+        return min(self.runs)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.runs)
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d.update(best=round(self.best, 4), median=round(self.median, 4),
+                 mb_per_sec=round((self.bytes / 1e6) / self.best, 2) if self.best > 0 else 0.0)
+        return d
+
+
+class Bench:
+    """Runs the phases against one source tree, using scratch dirs below work."""
+
+    def __init__(self, src: Path, work: Path, latency_s: float, verbose: bool):
+        self.src = src
+        self.work = work
+        self.latency_s = latency_s
+        self.verbose = verbose
+        self.copy_dest = work / "video_dest"
+
+    def _quiet(self):
+        return contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    def _time(self, fn: Callable[[], tuple]) -> tuple:
+        with self._quiet(), latency(self.src, self.latency_s):
+            t0 = time.perf_counter()
+            out = fn()
+            return time.perf_counter() - t0, out
+
+    def _fresh(self, path: Path) -> Path:
+        shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(parents=True)
+        return path
+
+    def scan(self) -> tuple:
+        manifest = Manifest.open(self.work / "none.sqlite", read_only=True)
+        rows = video.plan_copies(self.src, self.work / "batch", manifest)
+        manifest.close()
+        return len(rows), sum(r.size for r in rows)
+
+    def copy(self) -> tuple:
+        dest = self._fresh(self.copy_dest)
+        manifest = Manifest.open(dest / "manifest.sqlite")
+        dir_cache = video.DirCache(manifest, full_rescan=True)
+        plan = video.iter_plan(self.src, dest / "batch", manifest, dir_cache)
+        cnt = video.execute_copies(plan, manifest, dry_run=False, dest_root=dest)
+        dir_cache.commit(cnt.failed_paths)
+        manifest.save()
+        manifest.close()
+        return cnt.copied_ok, cnt.bytes_copied
+
+    def plan(self, full_rescan: bool) -> tuple:
+        manifest = Manifest.open(self.copy_dest / "manifest.sqlite", read_only=True)
+        dir_cache = video.DirCache(manifest, full_rescan=full_rescan)
+        rows = video.plan_copies(self.src, self.copy_dest / "batch2", manifest, dir_cache)
+        manifest.close()
+        return len(rows), sum(r.size for r in rows)
+
+    def zip(self) -> tuple:
+        dest = self._fresh(self.work / "data_dest")
+        base = dest / "backup_bench"
+        archive = data.ArchiveWriter(dest / "backup_bench.zip", root=base,
+                                     shards=min(4, os.cpu_count() or 1))
+        # the job's own folder lists, so the benchmark archives what the nightly run does
+        data.backup_multiwork_files(self.src, base, data.BackupOptions(
+            verbose=False, archive=archive, target_subfolders=data.EXPERIMENT_SUBFOLDERS))
+        data.backup_subjects_autodiscover(self.src, base, data.SUBJECT_FOLDERS, include_extra_p_rules=True,
+                                          archive=archive)
+        archive.close()
+        return archive.count, archive.total_bytes
+
+    def run(self, phases: List[str], repeat: int) -> List[PhaseResult]:
+        jobs: Dict[str, Callable[[], tuple]] = {
+            "scan": self.scan,
+            "copy": self.copy,
+            "plan": lambda: self.plan(full_rescan=False),
+            "plan_rescan": lambda: self.plan(full_rescan=True),
+            "zip": self.zip,
+        }
+        order = [p for p in ["scan", "copy", "plan", "plan_rescan", "zip"]
+                 if p in phases or (p == "plan_rescan" and "plan" in phases)]
+        if "plan" in phases and "copy" not in phases:
+            with self._quiet():
+                self.copy()  # plan needs the manifest a copy leaves behind
+        results = []
+        for name in order:
+            runs, files, nbytes = [], 0, 0
+            for _ in range(repeat):
+                seconds, (files, nbytes) = self._time(jobs[name])
+                runs.append(seconds)
+            results.append(PhaseResult(name, runs, files, nbytes))
+            r = results[-1]
+            print(f"  {name:<12} best {r.best:8.3f}s  median {r.median:8.3f}s  "
+                  f"{files:7d} files  {nbytes / 1e6:9.1f} MB")
+        return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Synthetic-tree benchmark for the backup scripts.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_gen = sub.add_parser("generate", help="write a synthetic multiwork tree")
+    p_gen.add_argument("root", type=Path)
+    p_gen.add_argument("--scale", choices=sorted(SCALES), default="small")
+    p_gen.add_argument("--seed", type=int, default=1)
+    p_run = sub.add_parser("run", help="time the backup phases")
+    p_run.add_argument("--root", type=Path, help="existing tree (default: generate one in a temp dir)")
+    p_run.add_argument("--scale", choices=sorted(SCALES), default="small")
+    p_run.add_argument("--seed", type=int, default=1)
+    p_run.add_argument("--latency-ms", type=float, default=0.0, help="added to each metadata call on the source")
+    p_run.add_argument("--repeat", type=int, default=3)
+    p_run.add_argument("--phases", default=",".join(PHASES))
+    p_run.add_argument("--json", type=Path, help="also write results here")
+    p_run.add_argument("--verbose", action="store_true", help="show the scripts' own output")
+    args = ap.parse_args()
+
+    spec = SCALES[args.scale]
+    spec.seed = args.seed
+    if args.cmd == "generate":
+        counts = generate_tree(args.root, spec)
+        print(f"[INFO] Generated {counts['files']} files, {counts['bytes'] / 1e6:.1f} MB in {args.root}")
+        return
+
+    phases = [p.strip() for p in args.phases.split(",") if p.strip()]
+    unknown = set(phases) - set(PHASES)
+    if unknown:
+        print(f"[ERROR] Unknown phases: {', '.join(sorted(unknown))}")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory(prefix="backup_bench_") as tmp:
+        work = Path(tmp)
+        src = args.root
+        if src is None:
+            src = work / "multiwork"
+            counts = generate_tree(src, spec)
+            print(f"[INFO] Generated {counts['files']} files, {counts['bytes'] / 1e6:.1f} MB ({args.scale})")
+        print(f"[INFO] Source: {src}  latency: {args.latency_ms} ms/call  repeat: {args.repeat}")
+        results = Bench(src, work, args.latency_ms / 1000.0, args.verbose).run(phases, max(1, args.repeat))
+
+    if args.json:
+        doc = {'scale': args.scale, 'seed': args.seed, 'latency_ms': args.latency_ms, 'repeat': args.repeat,
+               'root': str(args.root) if args.root else None, 'python': sys.version.split()[0],
+               'results': [r.to_dict() for r in results]}
+        args.json.write_text(json.dumps(doc, indent=2), encoding='utf-8')
+        print(f"[INFO] Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()